@@ -139,10 +139,16 @@
 #-----Groq----
 # agent.py - FINAL SINGLE /end-call CALL VERSION (with Groq via OpenAI-compatible API)
 import os
+import re
+import json
+import uuid
+import fcntl
 import asyncio
 import logging
 import httpx
 import time
+from collections import deque
+from typing import Dict, Optional
 from dotenv import load_dotenv
 from livekit import agents, rtc
 from livekit.agents import AgentSession, Agent, RoomInputOptions, UserInputTranscribedEvent
@@ -153,54 +159,398 @@ load_dotenv()
 BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
 USER_ID_FALLBACK = os.getenv("USER_ID")
 
+# Backend HTTP client (shared by every job in this worker process)
+BACKEND_HTTP2 = os.getenv("BACKEND_HTTP2", "false").lower() == "true"
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "20"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "10"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+
+# Transcript outbox: lines arriving within the window go out as one batch
+OUTBOX_WINDOW_SECONDS = float(os.getenv("OUTBOX_WINDOW_SECONDS", "0.3"))
+OUTBOX_MAX_BATCH = int(os.getenv("OUTBOX_MAX_BATCH", "20"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "10"))
+OUTBOX_DRAIN_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_DRAIN_TIMEOUT_SECONDS", "15"))
+
+# Disk spool for transcripts/finalize events the backend couldn't take
+AGENT_SPOOL_DIR = os.getenv("AGENT_SPOOL_DIR", ".agent_spool")
+OUTBOX_SPOOL_AFTER_FAILURES = int(os.getenv("OUTBOX_SPOOL_AFTER_FAILURES", "3"))
+AGENT_SPOOL_REPLAY_INTERVAL = float(os.getenv("AGENT_SPOOL_REPLAY_INTERVAL", "10"))
+
 logging.basicConfig(level=logging.INFO)
 
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_users = 0
+
+
+def acquire_http_client() -> httpx.AsyncClient:
+    """Return the worker's pooled keep-alive client, creating it on first use"""
+    global _http_client, _http_client_users
+    if _http_client is None or _http_client.is_closed:
+        http2 = BACKEND_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logging.warning("BACKEND_HTTP2 set but 'h2' is not installed; using HTTP/1.1")
+                http2 = False
+        _http_client = httpx.AsyncClient(
+            base_url=BACKEND_URL,
+            http2=http2,
+            timeout=20,
+            limits=httpx.Limits(
+                max_connections=BACKEND_MAX_CONNECTIONS,
+                max_keepalive_connections=BACKEND_MAX_KEEPALIVE,
+                keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY,
+            ),
+        )
+    _http_client_users += 1
+    return _http_client
+
+
+async def release_http_client():
+    """Drop one job's reference; the last job out closes the pool"""
+    global _http_client, _http_client_users
+    _http_client_users = max(0, _http_client_users - 1)
+    if _http_client_users == 0 and _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _post_ok(response: httpx.Response, what: str) -> bool:
+    """True if the backend took the request, or rejected it for good (don't retry)"""
+    if response.status_code < 400:
+        return True
+    if response.status_code < 500 and response.status_code not in (408, 429):
+        print(f"{what} rejected ({response.status_code}), dropping it")
+        return True
+    print(f"{what} failed ({response.status_code})")
+    return False
+
+
+async def post_lines(http: httpx.AsyncClient, lines) -> bool:
+    """Deliver lines without waiting for their analysis; the backend queues it"""
+    try:
+        response = await http.post(
+            "/process-transcription/batch",
+            json=lines,
+            params={"wait_for_analysis": "false"},
+            timeout=20,
+        )
+    except httpx.HTTPError as e:
+        print("Transcript error:", e)
+        return False
+    return _post_ok(response, f"Transcript batch of {len(lines)} lines")
+
+
+async def post_finalize(http: httpx.AsyncClient, room_id: str, user_id: str) -> bool:
+    """/end-call queues the backend's end-of-call job; safe to repeat"""
+    try:
+        response = await http.post(
+            "/end-call",
+            params={
+                "room_id": room_id,
+                "phone_number": "9999999999",
+                "userId": user_id,
+            },
+            timeout=20,
+        )
+    except httpx.HTTPError as e:
+        print("End-call error:", e)
+        return False
+    return _post_ok(response, "End-call")
+
+
+class TranscriptSpool:
+    """
+    Append-only JSONL file of events the backend hasn't acknowledged yet:
+    {"kind": "lines", "lines": [...]} and {"kind": "finalize", ...}.
+    Whoever is writing or replaying a file holds an exclusive flock on it,
+    which the OS drops if that process dies.
+    """
+
+    def __init__(self, path: str, fh):
+        self.path = path
+        self.fh = fh
+        self.offset = 0  # bytes already delivered
+
+    @classmethod
+    def create(cls, room_id: str) -> "TranscriptSpool":
+        os.makedirs(AGENT_SPOOL_DIR, exist_ok=True)
+        safe_room = re.sub(r"[^A-Za-z0-9_.-]", "_", room_id)
+        path = os.path.join(AGENT_SPOOL_DIR, f"{safe_room}-{time.time_ns()}.jsonl")
+        spool = cls.claim(path)
+        assert spool is not None
+        return spool
+
+    @classmethod
+    def claim(cls, path: str) -> Optional["TranscriptSpool"]:
+        """Open and lock an existing spool file, or None if someone else holds it"""
+        try:
+            fh = open(path, "a+b")
+        except OSError:
+            return None
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return None
+        return cls(path, fh)
+
+    def append(self, *entries: dict):
+        for entry in entries:
+            self.fh.write((json.dumps(entry) + "\n").encode("utf-8"))
+        self.fh.flush()
+
+    def pending(self):
+        """
+        (entry, end_offset) pairs that haven't been delivered yet. A torn
+        last line (the writer died mid-append) is cut off the file so later
+        appends start on a clean line; unreadable complete lines are skipped.
+        """
+        self.fh.seek(self.offset)
+        out = []
+        position = self.offset
+        for raw in self.fh:
+            if not raw.endswith(b"\n"):
+                print(f"Dropping torn trailing line ({len(raw)} bytes) in {self.path}")
+                self.fh.truncate(position)
+                break
+            position += len(raw)
+            if not raw.strip():
+                continue
+            try:
+                out.append((json.loads(raw), position))
+            except ValueError:
+                print(f"Skipping unreadable spool line in {self.path}")
+        return out
+
+    def remove(self):
+        os.remove(self.path)
+        self.fh.close()
+
+    def release(self):
+        self.fh.close()
+
+
+async def replay_spool(http: httpx.AsyncClient, spool: TranscriptSpool) -> bool:
+    """Deliver a spool file's events in order; True once everything went through"""
+    batch, batch_end = [], None
+    for entry, end_offset in spool.pending() + [(None, None)]:
+        # Consecutive line entries are replayed as one batch request
+        if entry is not None and entry["kind"] == "lines" and len(batch) < OUTBOX_MAX_BATCH:
+            batch.extend(entry["lines"])
+            batch_end = end_offset
+            continue
+        if batch:
+            if not await post_lines(http, batch):
+                return False
+            spool.offset = batch_end
+            batch, batch_end = [], None
+        if entry is None:
+            break
+        if entry["kind"] == "lines":
+            batch, batch_end = list(entry["lines"]), end_offset
+            continue
+        if not await post_finalize(http, entry["room_id"], entry["userId"]):
+            return False
+        spool.offset = end_offset
+    return True
+
+
+async def replay_orphaned_spools():
+    """
+    Background loop (one per worker process) that replays spool files left
+    behind by finished or crashed jobs once the backend is reachable again.
+    """
+    while True:
+        await asyncio.sleep(AGENT_SPOOL_REPLAY_INTERVAL)
+        if not os.path.isdir(AGENT_SPOOL_DIR):
+            continue
+        for name in sorted(os.listdir(AGENT_SPOOL_DIR)):
+            spool = TranscriptSpool.claim(os.path.join(AGENT_SPOOL_DIR, name))
+            if spool is None:
+                continue
+            http = acquire_http_client()
+            try:
+                if await replay_spool(http, spool):
+                    print(f"📤 Replayed spooled transcripts from {name}")
+                    spool.remove()
+                else:
+                    spool.release()
+                    break  # backend still down; try again next round
+            except Exception as e:
+                print(f"Spool replay of {name} failed: {e}")
+                spool.release()
+            finally:
+                await release_http_client()
+
+
+class TranscriptOutbox:
+    """
+    Per-room FIFO of transcript lines with a single sender task, so lines
+    reach the backend in the order they were spoken. Lines that arrive
+    within OUTBOX_WINDOW_SECONDS of each other are sent as one
+    /process-transcription/batch request; failed sends keep their place at
+    the head of the queue and are retried with exponential backoff. The
+    backend acknowledges a batch as soon as it is stored and queues the
+    analysis (wait_for_analysis=false), so one room's LLM calls never hold
+    back delivery of its next lines.
+
+    After OUTBOX_SPOOL_AFTER_FAILURES failed sends in a row the outbox
+    moves to a disk spool: queued and new lines are appended to the file
+    and the sender replays it until the backend catches up. Every line
+    carries an idempotency_key, so replaying a line twice is a no-op.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, room_id: str):
+        self.http = http_client
+        self.room_id = room_id
+        self.lines = deque()
+        self.spool: Optional[TranscriptSpool] = None
+        self.wakeup = asyncio.Event()
+        self.closing = False
+        self.task = asyncio.create_task(self._run())
+
+    def add(self, text: str, speaker: str):
+        line = {
+            "text": text,
+            "speaker": speaker,
+            "timestamp": time.time(),
+            "room_id": self.room_id,
+            "idempotency_key": uuid.uuid4().hex,
+        }
+        if self.spool is not None:
+            self.spool.append({"kind": "lines", "lines": [line]})
+        else:
+            self.lines.append(line)
+        self.wakeup.set()
+
+    def _start_spooling(self):
+        if self.spool is None:
+            self.spool = TranscriptSpool.create(self.room_id)
+            print(f"Backend unreachable, spooling transcripts for {self.room_id} to {self.spool.path}")
+        if self.lines:
+            self.spool.append({"kind": "lines", "lines": list(self.lines)})
+            self.lines.clear()
+
+    @property
+    def drained(self) -> bool:
+        return not self.lines and (self.spool is None or not self.spool.pending())
+
+    async def _run(self):
+        backoff = 0.5
+        failures = 0
+        while True:
+            if self.spool is not None:
+                try:
+                    replayed = await replay_spool(self.http, self.spool)
+                except Exception as e:
+                    # Keep the sender alive; the spool is retried after the backoff
+                    print(f"Spool replay for {self.room_id} failed: {e}")
+                    replayed = False
+                if replayed and not self.spool.pending():
+                    self.spool.remove()
+                    self.spool = None
+                    print(f"Backend caught up on spooled transcripts for {self.room_id}")
+                    continue
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, OUTBOX_MAX_BACKOFF_SECONDS)
+                continue
+
+            if not self.lines:
+                if self.closing:
+                    return
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            if not self.closing and len(self.lines) == 1:
+                # Give closely spaced lines a moment to join this batch
+                await asyncio.sleep(OUTBOX_WINDOW_SECONDS)
+
+            batch = [self.lines[i] for i in range(min(OUTBOX_MAX_BATCH, len(self.lines)))]
+            if await post_lines(self.http, batch):
+                for _ in batch:
+                    self.lines.popleft()
+                backoff = 0.5
+                failures = 0
+            else:
+                failures += 1
+                if failures >= OUTBOX_SPOOL_AFTER_FAILURES:
+                    self._start_spooling()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, OUTBOX_MAX_BACKOFF_SECONDS)
+
+    async def close(self, timeout: float) -> Optional[TranscriptSpool]:
+        """
+        Deliver what's queued (bounded by `timeout`) and stop the sender.
+        Returns the spool holding anything that's still undelivered.
+        """
+        self.closing = True
+        self.wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self.task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.lines:
+            self._start_spooling()
+        if self.spool is not None and self.drained:
+            self.spool.remove()
+            self.spool = None
+        return self.spool
+
+
 class Assistant(Agent):
-    def __init__(self, userId):
+    def __init__(self, userId, http_client: httpx.AsyncClient):
         super().__init__(instructions="You are a sales person. Convince customers to buy AI/ML courses.")
         self.fastapi_url = BACKEND_URL
         self.userId = userId
+        self.http = http_client
+        self.outboxes: Dict[str, TranscriptOutbox] = {}
 
-    async def send_transcript(self, text, room_id, speaker="user"):
-        try:
-            async with httpx.AsyncClient(timeout=20) as client:
-                await client.post(
-                    f"{self.fastapi_url}/process-transcription",
-                    json={
-                        "text": text,
-                        "speaker": speaker,
-                        "timestamp": time.time(),
-                        "room_id": room_id,
-                    }
-                )
-        except Exception as e:
-            print("Transcript error:", e)
+    def send_transcript(self, text, room_id, speaker="user"):
+        """Queue a line for ordered, batched delivery to the backend"""
+        if not text or not text.strip():
+            return
+        outbox = self.outboxes.get(room_id)
+        if outbox is None:
+            outbox = self.outboxes[room_id] = TranscriptOutbox(self.http, room_id)
+        outbox.add(text, speaker)
+
+    async def flush_transcripts(self):
+        """Drain every room's outbox, e.g. on job shutdown"""
+        outboxes, self.outboxes = list(self.outboxes.values()), {}
+        for outbox in outboxes:
+            spool = await outbox.close(timeout=OUTBOX_DRAIN_TIMEOUT_SECONDS)
+            if spool is not None:
+                spool.release()  # replay_orphaned_spools picks it up
 
     async def finalize(self, room_id):
         """Save session + generate summary ONCE only"""
-        try:
-            async with httpx.AsyncClient(timeout=20) as client:
-                await client.post(
-                    f"{self.fastapi_url}/save-session",
-                    params={"room_id": room_id}
-                )
-        except Exception as e:
-            print("Save session error:", e)
+        spool = None
+        outbox = self.outboxes.pop(room_id, None)
+        if outbox is not None:
+            spool = await outbox.close(timeout=OUTBOX_DRAIN_TIMEOUT_SECONDS)
 
-        await asyncio.sleep(2)
+        if spool is None:
+            if await post_finalize(self.http, room_id, self.userId):
+                return
+            spool = TranscriptSpool.create(room_id)
+
+        # Queue finalize behind any undelivered lines so it replays in order
+        spool.append({"kind": "finalize", "room_id": room_id, "userId": self.userId})
+        spool.release()
+        print(f"Finalize for {room_id} spooled until the backend is reachable")
 
-        try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                await client.post(
-                    f"{self.fastapi_url}/end-call",
-                    params={
-                        "room_id": room_id,
-                        "phone_number": "9999999999",
-                        "userId": self.userId,
-                    }
-                )
-        except Exception as e:
-            print("End-call error:", e)
+
+_spool_replayer: Optional[asyncio.Task] = None
+
+
+def ensure_spool_replayer():
+    global _spool_replayer
+    if _spool_replayer is None or _spool_replayer.done():
+        _spool_replayer = asyncio.create_task(replay_orphaned_spools())
 
 
 async def entrypoint(ctx: agents.JobContext):
@@ -214,9 +564,11 @@ async def entrypoint(ctx: agents.JobContext):
 
     userId = userId or USER_ID_FALLBACK or "anonymous-user"
 
-    assistant = Assistant(userId)
+    assistant = Assistant(userId, acquire_http_client())
+    ensure_spool_replayer()
 
     finalized = False
+    finalize_task: Optional[asyncio.Task] = None
 
     async def try_finalize():
         nonlocal finalized
@@ -228,8 +580,18 @@ async def entrypoint(ctx: agents.JobContext):
 
     @room.on("participant_disconnected")
     def on_disconnect(participant: rtc.RemoteParticipant):
-        if participant.identity != "agent":
-            asyncio.create_task(try_finalize())
+        nonlocal finalize_task
+        if participant.identity != "agent" and finalize_task is None:
+            finalize_task = asyncio.create_task(try_finalize())
+
+    async def on_shutdown():
+        # Let an in-flight finalize finish before the shared client goes away
+        if finalize_task is not None:
+            await asyncio.gather(finalize_task, return_exceptions=True)
+        await assistant.flush_transcripts()
+        await release_http_client()
+
+    ctx.add_shutdown_callback(on_shutdown)
 
     # Use OpenAI plugin with Groq's API endpoint
     session = AgentSession(
@@ -254,12 +616,12 @@ async def entrypoint(ctx: agents.JobContext):
     @session.on("user_input_transcribed")
     def on_user_text(event: UserInputTranscribedEvent):
         if event.is_final:
-            asyncio.create_task(assistant.send_transcript(event.transcript, room_name, "user"))
+            assistant.send_transcript(event.transcript, room_name, "user")
 
     @session.on("conversation_item_added")
     def on_ai(item):
         if getattr(item.item, "role", "") == "assistant":
-            asyncio.create_task(assistant.send_transcript(item.item.text_content, room_name, "assistant"))
+            assistant.send_transcript(item.item.text_content, room_name, "assistant")
 
     await session.start(room=room, agent=assistant, room_input_options=RoomInputOptions(close_on_disconnect=True))
     await ctx.connect()
@@ -0,0 +1,119 @@
+# coalescer.py - Single-flight, latest-wins analysis per room
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class _RoomFlight:
+    def __init__(self):
+        self.runner: Optional[asyncio.Task] = None
+        self.current: Optional[asyncio.Task] = None
+        self.current_record: Optional[dict] = None
+        self.pending: Optional[dict] = None
+        # Callers waiting on the in-flight line, and on the pending one
+        self.running: List[asyncio.Future] = []
+        self.waiters: List[asyncio.Future] = []
+        self.discarded = False
+
+
+class RoomAnalysisCoalescer:
+    """
+    At most one analysis runs per room. A user line that arrives while one
+    is in flight becomes the pending input (replacing any older pending
+    line); the in-flight call is cancelled or its result discarded. Every
+    caller whose line was superseded receives the newer line's analysis.
+
+    `analyze(text)` produces an analysis; `publish(room_id, analysis, sent_ts)`
+    is called with every analysis that was not superseded.
+    """
+
+    def __init__(
+        self,
+        analyze: Callable[[str], Awaitable[Any]],
+        publish: Callable[[str, Any, float], Any],
+        cancel_stale: bool,
+    ):
+        self.analyze = analyze
+        self.publish = publish
+        self.cancel_stale = cancel_stale
+        self.rooms: Dict[str, _RoomFlight] = {}
+        self.completed = 0
+        self.superseded = 0
+
+    async def submit(self, room_id: str, record: dict) -> Any:
+        flight = self.rooms.setdefault(room_id, _RoomFlight())
+        waiter = asyncio.get_running_loop().create_future()
+        flight.waiters.append(waiter)
+
+        newest = flight.pending or flight.current_record
+        if newest is None or record["sent_ts"] >= newest["sent_ts"]:
+            if flight.pending is not None:
+                self.superseded += 1
+            flight.pending = record
+            if self.cancel_stale and flight.current is not None and not flight.current.done():
+                flight.current.cancel()
+
+        if flight.runner is None or flight.runner.done():
+            flight.runner = asyncio.create_task(self._run(room_id, flight))
+
+        return await asyncio.shield(waiter)
+
+    async def _run(self, room_id: str, flight: _RoomFlight):
+        try:
+            while flight.pending is not None and not flight.discarded:
+                record, flight.pending = flight.pending, None
+                flight.running, flight.waiters = flight.running + flight.waiters, []
+                flight.current_record = record
+                flight.current = asyncio.create_task(self.analyze(record["text"]))
+                await asyncio.wait({flight.current})
+
+                if flight.discarded:
+                    # discard() already answered every caller
+                    return
+
+                if flight.current.cancelled() or flight.pending is not None:
+                    # Superseded: hand these callers over to the newer line
+                    self.superseded += 1
+                    flight.waiters, flight.running = flight.running + flight.waiters, []
+                    continue
+
+                # Nothing newer is pending, so later callers with older lines are answered too
+                waiters, flight.running, flight.waiters = flight.running + flight.waiters, [], []
+                error = flight.current.exception()
+                if error is None:
+                    result = flight.current.result()
+                    self.publish(room_id, result, record["sent_ts"])
+                    self.completed += 1
+                for waiter in waiters:
+                    if waiter.done():
+                        continue
+                    if error is None:
+                        waiter.set_result(result)
+                    else:
+                        waiter.set_exception(error)
+        finally:
+            flight.current = None
+            flight.current_record = None
+            if (
+                self.rooms.get(room_id) is flight
+                and flight.pending is None
+                and not flight.waiters
+                and not flight.running
+            ):
+                self.rooms.pop(room_id, None)
+
+    def discard(self, room_id: str, result: Any = None):
+        """
+        Forget a room: stop its analysis and resolve every caller still
+        waiting on it (in flight or pending) with `result`.
+        """
+        flight = self.rooms.pop(room_id, None)
+        if flight is None:
+            return
+        flight.discarded = True
+        flight.pending = None
+        if flight.current is not None:
+            flight.current.cancel()
+        waiters, flight.running, flight.waiters = flight.running + flight.waiters, [], []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(result)
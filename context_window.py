@@ -0,0 +1,116 @@
+# context_window.py - Token-budgeted conversation context for LLM prompts
+import re
+from typing import Iterable, List
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate BPE token count without a tokenizer download: one token per
+    punctuation mark and per short word, long words count one extra token
+    per 6 characters. Close enough to llama/GPT counts for English to size
+    prompts.
+    """
+    return sum(1 + len(piece) // 6 if piece[0].isalnum() or piece[0] == "_" else 1
+               for piece in _PIECES.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` at a word boundary so it fits in `max_tokens`"""
+    used = 0
+    for match in _PIECES.finditer(text):
+        piece = match.group()
+        used += 1 + len(piece) // 6 if piece[0].isalnum() or piece[0] == "_" else 1
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + " ..."
+    return text
+
+
+def format_turn(msg: dict) -> str:
+    return f"{'Customer' if msg['speaker'] == 'user' else 'Agent'}: {msg['text']}"
+
+
+def _gap(omitted: int) -> str:
+    return f"[... {omitted} earlier turn{'s' if omitted != 1 else ''} omitted ...]"
+
+
+def build_context(messages: List[dict], budget: int, recent_turns: int = 6) -> str:
+    """
+    Render as much of the conversation as fits in `budget` tokens. The last
+    `recent_turns` turns are taken first, then older customer turns, then
+    older agent turns, newest first within each group. Selected turns are
+    returned in their original order with markers where turns were left out.
+    """
+    if not messages:
+        return ""
+    lines = [format_turn(m) for m in messages]
+    costs = [count_tokens(line) + 1 for line in lines]
+    last = len(messages) - 1
+    recent_start = max(0, len(messages) - recent_turns)
+
+    def newest_first(indices: Iterable[int]) -> List[int]:
+        return sorted(indices, reverse=True)
+
+    older = range(recent_start)
+    order = (
+        newest_first(range(recent_start, len(messages)))
+        + newest_first(i for i in older if messages[i]["speaker"] == "user")
+        + newest_first(i for i in older if messages[i]["speaker"] != "user")
+    )
+
+    available = budget
+    chosen = {}
+    picked: List[int] = []
+    for i in order:
+        if costs[i] <= available:
+            chosen[i] = lines[i]
+            available -= costs[i]
+            picked.append(i)
+        elif i == last:
+            # Never drop the newest turn entirely; keep what fits of it
+            chosen[i] = truncate_to_tokens(lines[i], max(available, 1))
+            available = 0
+
+    # Gap markers cost tokens too: drop the lowest-priority turns until they fit
+    text = _render(len(messages), chosen)
+    while picked and count_tokens(text) + len(chosen) > budget:
+        victim = picked.pop()
+        if victim == last:
+            break
+        del chosen[victim]
+        text = _render(len(messages), chosen)
+    return text
+
+
+def _render(total: int, chosen: dict) -> str:
+    rendered: List[str] = []
+    omitted = 0
+    for i in range(total):
+        if i not in chosen:
+            omitted += 1
+            continue
+        if omitted:
+            rendered.append(_gap(omitted))
+            omitted = 0
+        rendered.append(chosen[i])
+    if omitted:
+        rendered.append(_gap(omitted))
+    return "\n".join(rendered)
+
+
+def chunk_messages(messages: List[dict], budget: int) -> List[List[dict]]:
+    """Split messages, in order, into consecutive windows of at most `budget` tokens"""
+    chunks: List[List[dict]] = []
+    current: List[dict] = []
+    used = 0
+    for msg in messages:
+        cost = count_tokens(format_turn(msg)) + 1
+        if current and used + cost > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(msg)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,160 @@
+# job_queue.py - Durable local job queue (SQLite-backed, no external service)
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    key: Optional[str]
+    payload: dict
+    attempts: int
+
+
+class JobQueue:
+    """
+    Append-only job table in a local SQLite file.
+
+    Jobs survive process restarts: anything left RUNNING when the process
+    died is put back to PENDING by `recover()`. All calls are short local
+    writes, so they are made directly from the event loop thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                key TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_after REAL NOT NULL,
+                last_error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_claim_idx ON jobs (kind, status, run_after, id)"
+        )
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS jobs_key_idx ON jobs (kind, key) WHERE key IS NOT NULL"
+        )
+
+    def put(self, kind: str, payload: dict, key: Optional[str] = None) -> Optional[int]:
+        """Enqueue a job. Returns None if a job with the same (kind, key) already exists."""
+        now = time.time()
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO jobs (kind, key, payload, status, run_after, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (kind, key, json.dumps(payload), PENDING, now, now, now),
+        )
+        return cur.lastrowid if cur.rowcount else None
+
+    def claim(self, kind: str) -> Optional[Job]:
+        """Mark the oldest runnable job of `kind` as RUNNING and return it."""
+        now = time.time()
+        row = self.conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE kind = ? AND status = ? AND run_after <= ? "
+            "ORDER BY id LIMIT 1) "
+            "RETURNING id, kind, key, payload, attempts",
+            (RUNNING, now, kind, PENDING, now),
+        ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            id=row["id"],
+            kind=row["kind"],
+            key=row["key"],
+            payload=json.loads(row["payload"]),
+            attempts=row["attempts"],
+        )
+
+    def complete(self, job_id: int, result: Optional[dict] = None) -> None:
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+            (DONE, json.dumps(result) if result is not None else None, time.time(), job_id),
+        )
+
+    def fail(self, job_id: int, error: str, retry_in: Optional[float] = None) -> None:
+        """Record a failure; reschedule after `retry_in` seconds, or give up if None."""
+        now = time.time()
+        if retry_in is None:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (FAILED, error, now, job_id),
+            )
+        else:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, run_after = ?, updated_at = ? WHERE id = ?",
+                (PENDING, error, now + retry_in, now, job_id),
+            )
+
+    def retry_failed(self, kind: str, key: str, payload: Optional[dict] = None) -> bool:
+        """Give a FAILED keyed job a fresh set of attempts (and optionally a new payload)."""
+        now = time.time()
+        cur = self.conn.execute(
+            "UPDATE jobs SET status = ?, attempts = 0, payload = COALESCE(?, payload), "
+            "run_after = ?, updated_at = ? WHERE kind = ? AND key = ? AND status = ?",
+            (PENDING, json.dumps(payload) if payload is not None else None, now, now, kind, key, FAILED),
+        )
+        return cur.rowcount > 0
+
+    def status(self, kind: str, key: str) -> Optional[dict]:
+        """Status, attempts, last error and result of the keyed job, if any."""
+        row = self.conn.execute(
+            "SELECT id, status, attempts, last_error, result, created_at, updated_at "
+            "FROM jobs WHERE kind = ? AND key = ?",
+            (kind, key),
+        ).fetchone()
+        if row is None:
+            return None
+        info = dict(row)
+        info["result"] = json.loads(info["result"]) if info["result"] else None
+        return info
+
+    def recover(self) -> int:
+        """Requeue jobs that were RUNNING when the previous process exited."""
+        cur = self.conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+            (PENDING, time.time(), RUNNING),
+        )
+        return cur.rowcount
+
+    def depth(self, kind: str) -> int:
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE kind = ? AND status IN (?, ?)",
+            (kind, PENDING, RUNNING),
+        ).fetchone()
+        return row[0]
+
+    def purge(self, done_older_than: float, failed_older_than: float) -> int:
+        """Delete DONE and FAILED jobs last touched longer ago than their retention."""
+        now = time.time()
+        cur = self.conn.execute(
+            "DELETE FROM jobs WHERE (status = ? AND updated_at < ?) OR (status = ? AND updated_at < ?)",
+            (DONE, now - done_older_than, FAILED, now - failed_older_than),
+        )
+        return cur.rowcount
+
+    def close(self) -> None:
+        self.conn.close()
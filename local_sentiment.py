@@ -0,0 +1,139 @@
+# local_sentiment.py - CPU-only lexicon sentiment scorer for the analysis fast path
+import re
+from typing import Dict, List
+
+# Weighted cues for sales conversations. Multi-word phrases are matched
+# before single words, and their words are not scored again.
+POSITIVE: Dict[str, float] = {
+    "sign me up": 3, "sounds good": 2, "sounds great": 2.5, "i'm interested": 2.5,
+    "im interested": 2.5, "that's great": 2, "let's do it": 3, "lets do it": 3,
+    "tell me more": 1.5, "makes sense": 1.5, "i like": 1.5, "i love": 2,
+    "interested": 2, "great": 2, "perfect": 2, "awesome": 2, "amazing": 2,
+    "excellent": 2, "love": 2, "helpful": 1.5, "good": 1, "nice": 1, "cool": 1,
+    "yes": 1, "yeah": 1, "sure": 1, "definitely": 1.5, "absolutely": 1.5,
+    "thanks": 0.5, "thank": 0.5, "enroll": 2, "register": 1.5, "buy": 1.5,
+    "excited": 2, "useful": 1.5, "valuable": 1.5,
+}
+NEGATIVE: Dict[str, float] = {
+    "not interested": 3, "no thanks": 2.5, "no thank you": 2.5, "too expensive": 2.5,
+    "too much": 1.5, "waste of time": 3, "stop calling": 3, "end the call": 2,
+    "call me later": 1.5, "don't call": 3, "dont call": 3, "not now": 1.5,
+    "expensive": 1.5, "busy": 1, "scam": 3, "hate": 2.5, "bad": 1.5,
+    "terrible": 2.5, "annoying": 2, "useless": 2.5, "boring": 2, "confused": 1,
+    "confusing": 1.5, "no": 1, "nope": 1.5, "never": 1.5, "cancel": 2,
+    "unsubscribe": 3, "refund": 2, "worried": 1.5, "doubt": 1.5, "problem": 1,
+}
+NEGATIONS = {"not", "no", "never", "don't", "dont", "isn't", "isnt", "can't", "cant",
+             "won't", "wont", "didn't", "didnt", "doesn't", "doesnt", "hardly"}
+INTENSIFIERS = {"very": 1.5, "really": 1.5, "so": 1.3, "extremely": 1.8, "super": 1.5, "totally": 1.5}
+
+PRICING = re.compile(r"\b(price|pricing|cost|costs|fee|fees|how much|discount|pay|payment|emi|afford)\b")
+SCHEDULE = re.compile(r"\b(when|schedule|start date|duration|how long|timing|weekend|weekday)\b")
+CONTENT = re.compile(r"\b(syllabus|curriculum|course|courses|modules?|projects?|certificate|certification|placement|job)\b")
+
+_PHRASES = sorted(
+    [(p, w) for p, w in POSITIVE.items() if " " in p] + [(p, -w) for p, w in NEGATIVE.items() if " " in p],
+    key=lambda item: -len(item[0]),
+)
+_WORDS = {**{w: s for w, s in POSITIVE.items() if " " not in w},
+          **{w: -s for w, s in NEGATIVE.items() if " " not in w}}
+
+
+def normalize_utterance(text: str) -> str:
+    """
+    Lowercase, drop punctuation and collapse whitespace. Shared with the
+    analysis cache key and the trivial-utterance gate in main.py.
+    """
+    text = re.sub(r"[^\w\s']", " ", text.lower())
+    return " ".join(text.split())
+
+
+def score_utterance(text: str) -> dict:
+    """
+    Score one customer utterance with the lexicon. Returns a dict shaped like
+    the LLM analysis. Confidence grows with the net cue weight and drops
+    when positive and negative cues conflict.
+    """
+    normalized = normalize_utterance(text)
+    padded = f" {normalized} "
+    score = 0.0
+    cues: List[str] = []
+    hits_pos = hits_neg = 0
+
+    for phrase, weight in _PHRASES:
+        needle = f" {phrase} "
+        if needle in padded:
+            score += weight
+            cues.append(phrase)
+            hits_pos += weight > 0
+            hits_neg += weight < 0
+            padded = padded.replace(needle, " ")
+
+    tokens = padded.split()
+    negate_left = 0
+    boost = 1.0
+    for token in tokens:
+        if token in NEGATIONS and token not in _WORDS:
+            negate_left = 3
+            continue
+        if token in INTENSIFIERS:
+            boost = INTENSIFIERS[token]
+            continue
+        weight = _WORDS.get(token)
+        if weight is not None:
+            cue = token
+            if negate_left and token not in NEGATIONS:
+                weight = -weight * 0.8
+                cue = f"not {token}"
+            weight *= boost
+            score += weight
+            cues.append(cue)
+            hits_pos += weight > 0
+            hits_neg += weight < 0
+            if token in NEGATIONS:
+                negate_left = 3
+        boost = 1.0
+        negate_left = max(0, negate_left - 1)
+
+    if score >= 1:
+        sentiment = "positive"
+    elif score <= -1:
+        sentiment = "negative"
+    else:
+        sentiment = "neutral"
+
+    if not cues:
+        confidence = 0.3
+    else:
+        confidence = min(0.95, 0.5 + 0.12 * abs(score))
+        if hits_pos and hits_neg:
+            confidence *= 0.7
+        if sentiment == "neutral":
+            confidence = min(confidence, 0.5)
+
+    key_points: List[str] = []
+    asks_pricing = bool(PRICING.search(normalized))
+    if asks_pricing:
+        key_points.append("Customer asked about pricing")
+    if SCHEDULE.search(normalized):
+        key_points.append("Customer asked about schedule or duration")
+    if CONTENT.search(normalized):
+        key_points.append("Customer asked about course content or outcomes")
+    if cues:
+        key_points.append(f"{sentiment.capitalize()} cues: {', '.join(cues[:4])}")
+
+    if sentiment == "negative":
+        recommendation = "Acknowledge the concern and ask what is holding them back."
+    elif asks_pricing:
+        recommendation = "Share pricing clearly and mention discounts or payment plans."
+    elif sentiment == "positive":
+        recommendation = "Customer is receptive - move toward next steps or enrollment."
+    else:
+        recommendation = "Ask an open question to learn what the customer needs."
+
+    return {
+        "sentiment": sentiment,
+        "confidence": round(confidence, 2),
+        "key_points": key_points,
+        "recommendation_to_salesperson": recommendation,
+    }
@@ -987,19 +987,23 @@
 
 
 import os
+import re
 import json
+import asyncio
 import logging
-from datetime import datetime, timezone
-from typing import Literal, List, Dict, Optional
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Literal, List, Dict, Optional, Set, Tuple
 
-from fastapi import FastAPI, HTTPException, Query, Depends, status
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Response, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import uvicorn
-from groq import Groq
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import PyMongoError, OperationFailure
+from groq import AsyncGroq
+from pymongo.errors import PyMongoError
 from livekit import api
 
 # Import auth helpers (must exist in your project)
@@ -1008,6 +1012,14 @@ from auth import (
     hash_password, verify_password, create_access_token,
     user_to_response, security, decode_token
 )
+from job_queue import Job, JobQueue, PENDING, RUNNING
+from cache import TTLCache
+from write_buffer import WriteBehindBuffer
+from coalescer import RoomAnalysisCoalescer
+from repository import Database, RATING_BY_EXPERIENCE, DEFAULT_RATING
+from room_events import RoomEventHub
+from local_sentiment import normalize_utterance, score_utterance
+from context_window import build_context, chunk_messages, count_tokens, truncate_to_tokens
 
 # -------------------------------------------------------------------
 # SETUP
@@ -1019,7 +1031,101 @@ logging.basicConfig(level=logging.INFO)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("GROQ_API_KEY not found in environment variables")
-groq_client = Groq(api_key=GROQ_API_KEY)
+groq_client = AsyncGroq(api_key=GROQ_API_KEY)
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+# Upper bound on in-flight Groq requests so a burst of rooms can't exhaust
+# sockets or hit the rate limit all at once.
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "16"))
+groq_semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+# Utterance-level analysis cache. Bump ANALYSIS_PROMPT_VERSION whenever the
+# analyze_with_groq prompt changes so stale results are never served.
+ANALYSIS_PROMPT_VERSION = "v1"
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "2048"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "3600"))
+analysis_cache = TTLCache(maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL)
+
+# Per-user /dashboard/stats and /recent-calls responses, keyed by
+# (userId, endpoint, ...). The end-call job drops a user's entries when it
+# stores their call; the TTL only bounds how late the 30-day windows roll.
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "1024"))
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+dashboard_cache = TTLCache(maxsize=DASHBOARD_CACHE_SIZE, ttl=DASHBOARD_CACHE_TTL)
+# Bumped by every invalidation, so a read that started before it never
+# caches its (stale) result afterwards
+DASHBOARD_GENERATIONS: Dict[str, int] = {}
+
+# Authenticated user documents, so a cached dashboard refresh needs no
+# Mongo round trip at all. Users are never modified through the API.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Tiered sentiment: every user line is scored locally first and published
+# as a provisional analysis. The LLM is only called when the local score is
+# below LOCAL_SENTIMENT_MIN_CONFIDENCE or every LLM_EVERY_N_USER_LINES lines
+# per room (0 disables the cadence).
+LOCAL_SENTIMENT_ENABLED = os.getenv("LOCAL_SENTIMENT_ENABLED", "true").lower() == "true"
+LOCAL_SENTIMENT_MIN_CONFIDENCE = float(os.getenv("LOCAL_SENTIMENT_MIN_CONFIDENCE", "0.7"))
+LLM_EVERY_N_USER_LINES = int(os.getenv("LLM_EVERY_N_USER_LINES", "4"))
+LINES_SINCE_LLM: Dict[str, int] = {}
+SENTIMENT_TIER_COUNTS = {"local": 0, "llm": 0}
+
+# Trivial-utterance gate: greetings, mic checks and fillers are stored but
+# never analyzed, so they can't replace a meaningful room analysis.
+TRIVIAL_GATE_ENABLED = os.getenv("TRIVIAL_GATE_ENABLED", "true").lower() == "true"
+TRIVIAL_MIN_CHARS = int(os.getenv("TRIVIAL_MIN_CHARS", "2"))
+TRIVIAL_STOP_PHRASES = {
+    phrase.strip()
+    for phrase in os.getenv(
+        "TRIVIAL_STOP_PHRASES",
+        "are you able to hear me,can you hear me,am i audible,is this working,"
+        "hello,hello hello,hey hi,hi there,one second,just a second,give me a second,"
+        "sorry,sorry what,pardon,come again",
+    ).split(",")
+    if phrase.strip()
+}
+# Trivial lines are short; longer ones skip the checks (and the regex)
+TRIVIAL_MAX_CHARS = int(os.getenv("TRIVIAL_MAX_CHARS", "60"))
+_FILLER = (
+    r"(?:u+h+m*|u+m+|h+m+|a+h+|o+h+|ok(?:ay)?|hi+|hey+|hello|yo|so|well|right|alright|"
+    r"i see|got it|mhm|uh huh)"
+)
+# Fillers separated by single spaces (input is normalized), so there is
+# only one way to split a line and matching stays linear
+TRIVIAL_FILLER_PATTERN = re.compile(rf"^{_FILLER}(?: {_FILLER})*$")
+TRIVIAL_GATE_COUNTS = {"checked": 0, "skipped": 0}
+
+# Rolling per-room summary: once ROLLING_SUMMARY_FOLD_TURNS lines are older
+# than the last ROLLING_SUMMARY_RECENT_TURNS, they are folded into a short
+# LLM-maintained summary so full-conversation analysis stays bounded.
+# ROLLING_SUMMARY_FOLD_TURNS=0 disables folding.
+ROLLING_SUMMARY_RECENT_TURNS = int(os.getenv("ROLLING_SUMMARY_RECENT_TURNS", "12"))
+ROLLING_SUMMARY_FOLD_TURNS = int(os.getenv("ROLLING_SUMMARY_FOLD_TURNS", "20"))
+ROLLING_SUMMARY_MAX_WORDS = int(os.getenv("ROLLING_SUMMARY_MAX_WORDS", "200"))
+
+# Token budget for the conversation/utterance part of each prompt type.
+# build_context keeps the last CONTEXT_RECENT_TURNS turns, then older
+# customer turns, then older agent turns until the budget is spent.
+CONTEXT_BUDGETS = {
+    "utterance": int(os.getenv("CONTEXT_BUDGET_UTTERANCE", "300")),
+    "full_analysis": int(os.getenv("CONTEXT_BUDGET_FULL_ANALYSIS", "1500")),
+    "summary_fold": int(os.getenv("CONTEXT_BUDGET_SUMMARY_FOLD", "1500")),
+    "end_call": int(os.getenv("CONTEXT_BUDGET_END_CALL", "3000")),
+}
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "6"))
+
+# End-of-call analysis: transcripts larger than the "end_call" budget (and
+# without a rolling summary) are condensed chunk by chunk, at most
+# CALL_SUMMARY_CONCURRENCY at once per call, before the single final pass.
+CALL_SUMMARY_CONCURRENCY = int(os.getenv("CALL_SUMMARY_CONCURRENCY", "4"))
+CALL_SUMMARY_NOTE_WORDS = int(os.getenv("CALL_SUMMARY_NOTE_WORDS", "150"))
+
+# Dashboard stats come from the per-day user_stats rollups, backfilled from
+# call_summaries at startup while user_stats is empty (rebuild_user_stats.py
+# recomputes them by hand); "false" aggregates call_summaries instead
+DASHBOARD_FROM_ROLLUPS = os.getenv("DASHBOARD_FROM_ROLLUPS", "true").lower() == "true"
 
 # === LiveKit Setup ===
 LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
@@ -1034,56 +1140,113 @@ MONGO_URI = os.getenv("MONGODB_URI")
 if not MONGO_URI:
     raise ValueError("MONGODB_URI not found in environment variables")
 
-try:
-    client = MongoClient(MONGO_URI, connect=False, serverSelectionTimeoutMS=30000)
-    client.admin.command("ping")
-    logging.info("✅ Connected to MongoDB")
-except PyMongoError as e:
-    logging.error(f"❌ Mongo error: {e}")
-    raise
-
-db = client["sales_agent"]
-
-# Create collections if they don't exist
-for col in ["messages", "transcripts", "call_summaries", "users"]:
-    if col not in db.list_collection_names():
-        db.create_collection(col)
-
-messages_collection = db["messages"]
-sessions_collection = db["transcripts"]
-call_summaries_collection = db["call_summaries"]
-users_collection = db["users"]
-
-# ✅ SAFE INDEX CREATION
-try:
-    messages_collection.create_index(
-        [("room_id", ASCENDING), ("sent_ts", ASCENDING)],
-        name="room_ts_idx"
-    )
-except OperationFailure as e:
-    logging.warning(f"Could not create messages index (may already exist): {e}")
-
-try:
-    users_collection.create_index("email", unique=True, name="email_idx")
-except OperationFailure as e:
-    logging.warning(f"Could not create users index (may already exist): {e}")
-
-try:
-    call_summaries_collection.create_index("userId", name="userId_idx")
-except OperationFailure as e:
-    logging.warning(f"Could not create call_summaries index (may already exist): {e}")
-
-try:
-    sessions_collection.create_index(
-        [("session_id", ASCENDING), ("timestamp", ASCENDING)],
-        name="session_ts_idx"
-    )
-except OperationFailure as e:
-    logging.warning(f"Could not create sessions index (may already exist): {e}")
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+# Collections and indexes are ensured on startup (see start_background_tasks)
+database = Database(
+    MONGO_URI,
+    max_pool_size=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+    min_pool_size=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    server_selection_timeout_ms=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000")),
+    connect_timeout_ms=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000")),
+    socket_timeout_ms=_optional_int("MONGO_SOCKET_TIMEOUT_MS"),
+    wait_queue_timeout_ms=_optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+)
+
+# === Write-behind persistence for live messages ===
+def room_identity(room_id: str) -> Tuple[str, Optional[str]]:
+    """(alias, userId) encoded in a LiveKit room name: <alias>-user-<userId>"""
+    if "-user-" in room_id:
+        alias, user_id = room_id.rsplit("-user-", 1)
+        return alias, user_id
+    return room_id, None
+
+
+async def persist_messages(docs: List[dict]) -> None:
+    """Write-behind sink: store messages, then bump the room registry counters"""
+    inserted = await database.messages.insert_many(docs)
+    rooms: Dict[str, dict] = {}
+    for doc in inserted:
+        room = rooms.get(doc["room_id"])
+        if room is None:
+            alias, user_id = room_identity(doc["room_id"])
+            room = rooms[doc["room_id"]] = {
+                "alias": alias, "userId": user_id, "count": 0,
+                "first_ts": doc["sent_ts"], "last_ts": doc["sent_ts"],
+            }
+        room["count"] += 1
+        room["first_ts"] = min(room["first_ts"], doc["sent_ts"])
+        room["last_ts"] = max(room["last_ts"], doc["sent_ts"])
+    try:
+        await database.rooms.record_messages(rooms)
+    except PyMongoError as e:
+        # The messages themselves are stored; don't make the buffer retry them
+        logging.error(f"Room registry update failed for {len(rooms)} rooms: {e}")
+
+
+message_buffer = WriteBehindBuffer(
+    persist_messages,
+    flush_size=int(os.getenv("MESSAGE_FLUSH_SIZE", "100")),
+    flush_interval=float(os.getenv("MESSAGE_FLUSH_INTERVAL", "1.0")),
+    max_buffered=int(os.getenv("MESSAGE_BUFFER_MAX", "50000")),
+)
 
 # === In-memory temporary stores ===
 STORE: Dict[str, List[dict]] = {}
+# Rolling summary of the older part of each STORE room (see fold_room_summary)
+ROLLING_SUMMARIES: Dict[str, "RollingSummary"] = {}
 ANALYSIS_STORE: Dict[str, dict] = {}
+# sent_ts of the user message behind each ANALYSIS_STORE entry
+ANALYZED_TS: Dict[str, float] = {}
+
+# === Ingest idempotency ===
+# Recently seen idempotency keys per room (most recent rooms kept), so
+# retried or replayed lines are accepted once only. Lines sent without a
+# key get one derived from speaker and timestamp; messages also carry the
+# key in Mongo, where a unique index drops duplicates that outlive the window.
+IDEMPOTENCY_WINDOW = int(os.getenv("IDEMPOTENCY_WINDOW", "1000"))
+IDEMPOTENCY_MAX_ROOMS = int(os.getenv("IDEMPOTENCY_MAX_ROOMS", "10000"))
+RECENT_KEYS: "OrderedDict[str, OrderedDict]" = OrderedDict()
+IDEMPOTENCY_COUNTS = {"accepted": 0, "duplicates": 0, "derived_keys": 0}
+
+# === Live push to viewers (WebSocket / SSE) ===
+ROOM_PUSH_HEARTBEAT_SECONDS = float(os.getenv("ROOM_PUSH_HEARTBEAT_SECONDS", "15"))
+room_events = RoomEventHub(
+    queue_size=int(os.getenv("ROOM_PUSH_QUEUE_SIZE", "256")),
+    history_size=int(os.getenv("ROOM_PUSH_HISTORY_SIZE", "200")),
+)
+
+# === Ingest / Analysis Pipeline ===
+# "inline": analyze before responding (default)
+# "background": accept with 202 and let the worker pool fill ANALYSIS_STORE
+# (/process-transcription/batch?wait_for_analysis=false opts in per request)
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "inline")
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "5"))
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.sqlite3")
+JOB_RETENTION_SECONDS = 3600
+# FAILED jobs are kept longer so they can be inspected (or retried by /end-call)
+JOB_FAILED_RETENTION_SECONDS = float(os.getenv("JOB_FAILED_RETENTION_SECONDS", "86400"))
+JOB_PURGE_INTERVAL_SECONDS = float(os.getenv("JOB_PURGE_INTERVAL_SECONDS", "60"))
+# Cancel an in-flight room analysis as soon as a newer user line arrives
+# (otherwise it finishes and its result is discarded)
+ANALYSIS_CANCEL_STALE = os.getenv("ANALYSIS_CANCEL_STALE", "true").lower() == "true"
+
+TRANSCRIPT_JOB = "transcript"
+job_queue = JobQueue(JOB_QUEUE_PATH)
+job_wakeup = asyncio.Event()
+worker_tasks: List[asyncio.Task] = []
+analysis_tasks: Set[asyncio.Task] = set()
+
+# === End-of-call pipeline ===
+# /end-call only enqueues a job keyed by room_id (with a snapshot of the
+# messages); a worker pool writes the transcript and summary, with retries
+END_CALL_JOB = "end_call"
+END_CALL_WORKERS = int(os.getenv("END_CALL_WORKERS", "2"))
+END_CALL_MAX_ATTEMPTS = int(os.getenv("END_CALL_MAX_ATTEMPTS", "5"))
+end_call_wakeup = asyncio.Event()
 
 # -------------------------------------------------------------------
 # MODELS
@@ -1093,12 +1256,14 @@ class TranscriptIn(BaseModel):
     speaker: Literal["user", "assistant"]
     timestamp: float
     room_id: str
+    idempotency_key: Optional[str] = Field(None, max_length=128)
 
 class SentimentAnalysis(BaseModel):
     sentiment: str
     confidence: float
     key_points: List[str]
     recommendation_to_salesperson: str
+    source: Literal["local", "llm"] = "llm"
 
 class TranscriptResponse(BaseModel):
     ok: bool
@@ -1106,6 +1271,16 @@ class TranscriptResponse(BaseModel):
     count_in_room: int
     analysis: Optional[SentimentAnalysis] = None
     latest_user_message: Optional[str] = None
+    queued: bool = False
+    duplicate: bool = False
+
+class BatchTranscriptResponse(BaseModel):
+    ok: bool
+    accepted: int
+    count_in_room: Dict[str, int]
+    analysis: Dict[str, SentimentAnalysis] = {}
+    queued: bool = False
+    duplicates: int = 0
 
 class SaveSessionResponse(BaseModel):
     ok: bool
@@ -1150,9 +1325,12 @@ async def get_current_user_dep(credentials = Depends(security)) -> dict:
     payload = decode_token(token)
     user_id = payload.get("sub")
 
-    user = users_collection.find_one({"_id": user_id})
-    if not user:
-        raise HTTPException(401, "Invalid authentication")
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await database.users.get_by_id(user_id)
+        if not user:
+            raise HTTPException(401, "Invalid authentication")
+        user_cache.set(user_id, user)
 
     return user
 
@@ -1161,7 +1339,7 @@ async def get_current_user_dep(credentials = Depends(security)) -> dict:
 # -------------------------------------------------------------------
 @app.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
-    if users_collection.find_one({"email": user_data.email}):
+    if await database.users.get_by_email(user_data.email):
         raise HTTPException(400, "Email already registered")
 
     user_id = f"user_{int(datetime.now(timezone.utc).timestamp()*1000)}"
@@ -1169,14 +1347,14 @@ async def register(user_data: UserCreate):
     user_doc = {
         "_id": user_id,
         "email": user_data.email,
-        "password": hash_password(user_data.password),
+        "password": await asyncio.to_thread(hash_password, user_data.password),
         "full_name": user_data.full_name,
         "phone_number": user_data.phone_number,
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
 
-    users_collection.insert_one(user_doc)
+    await database.users.create(user_doc)
 
     token = create_access_token({"sub": user_id, "email": user_data.email})
     return Token(access_token=token, token_type="bearer", user=user_to_response(user_doc))
@@ -1184,8 +1362,8 @@ async def register(user_data: UserCreate):
 
 @app.post("/auth/login", response_model=Token)
 async def login(credentials: UserLogin):
-    user = users_collection.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user["password"]):
+    user = await database.users.get_by_email(credentials.email)
+    if not user or not await asyncio.to_thread(verify_password, credentials.password, user["password"]):
         raise HTTPException(401, "Invalid email or password")
 
     token = create_access_token({"sub": user["_id"], "email": user["email"]})
@@ -1199,6 +1377,16 @@ async def get_me(current_user=Depends(get_current_user_dep)):
 # -------------------------------------------------------------------
 # LIVEKIT TOKEN ENDPOINT
 # -------------------------------------------------------------------
+room_registrations: Set[asyncio.Task] = set()
+
+
+async def register_room(room_id: str, alias: str, user_id: Optional[str]):
+    try:
+        await database.rooms.register(room_id, alias, user_id)
+    except PyMongoError as e:
+        logging.error(f"Could not register room {room_id}: {e}")
+
+
 @app.post("/get-token")
 async def get_token(request: TokenRequest):
     try:
@@ -1223,6 +1411,12 @@ async def get_token(request: TokenRequest):
 
         jwt_token = token.to_jwt()
 
+        # Fire-and-forget: ingest upserts the room too, so a slow or down
+        # Mongo must not hold up token issuance
+        task = asyncio.create_task(register_room(room_with_user, request.room_name, user_id))
+        room_registrations.add(task)
+        task.add_done_callback(room_registrations.discard)
+
         return {
             "token": jwt_token,
             "url": LIVEKIT_WS_URL,
@@ -1237,10 +1431,62 @@ async def get_token(request: TokenRequest):
 # -------------------------------------------------------------------
 # GROQ ANALYSIS FUNCTIONS
 # -------------------------------------------------------------------
-def analyze_with_groq(user_text: str) -> dict:
+async def groq_chat(system_prompt: str, prompt: str, max_tokens: int) -> str:
+    """Run one chat completion on the async client and return the raw text"""
+    async with groq_semaphore:
+        response = await groq_client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens
+        )
+    return response.choices[0].message.content.strip()
+
+
+def is_trivial_utterance(text: str) -> bool:
+    """True for lines too short or content-free to be worth analyzing"""
+    if len(text) > TRIVIAL_MAX_CHARS:
+        return False
+    normalized = normalize_utterance(text)
+    return (
+        len(normalized) < TRIVIAL_MIN_CHARS
+        or normalized in TRIVIAL_STOP_PHRASES
+        or TRIVIAL_FILLER_PATTERN.match(normalized) is not None
+    )
+
+
+def copy_analysis(analysis_dict: dict) -> dict:
+    return {**analysis_dict, "key_points": list(analysis_dict.get("key_points", []))}
+
+
+# Served when the LLM analysis fails and there is no local result to keep
+ANALYSIS_FALLBACK = {
+    "sentiment": "neutral",
+    "confidence": 0.0,
+    "key_points": [],
+    "recommendation_to_salesperson": "Unable to analyze.",
+}
+
+
+async def analyze_with_groq(user_text: str) -> dict:
+    """LLM analysis of one utterance; raises if Groq fails or returns bad JSON"""
+    cache_key = (GROQ_MODEL, ANALYSIS_PROMPT_VERSION, normalize_utterance(user_text))
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return copy_analysis(cached)
+
     prompt = f"""
 Analyze the customer's message:
-"{user_text}"
+"{truncate_to_tokens(user_text, CONTEXT_BUDGETS["utterance"])}"
 
 Return strict JSON only:
 {{
@@ -1252,23 +1498,11 @@ Return strict JSON only:
 """
 
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a sales conversation analyst. Always respond with valid JSON only, no markdown or explanations."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.3,
-            max_tokens=500
+        raw = await groq_chat(
+            "You are a sales conversation analyst. Always respond with valid JSON only, no markdown or explanations.",
+            prompt,
+            max_tokens=500,
         )
-        
-        raw = response.choices[0].message.content.strip()
 
         # clean markdown fences
         if raw.startswith("```"):
@@ -1279,7 +1513,7 @@ Return strict JSON only:
 
         parsed = json.loads(raw)
 
-        return {
+        result = {
             "sentiment": parsed.get("sentiment", "neutral").lower(),
             "confidence": float(parsed.get("confidence", 0.0)),
             "key_points": parsed.get("key_points", []),
@@ -1288,188 +1522,363 @@ Return strict JSON only:
                 "Continue the conversation normally."
             ),
         }
+        analysis_cache.set(cache_key, copy_analysis(result))
+        return result
 
-    except Exception as e:
+    except Exception:
         logging.exception("Groq error")
-        return {
-            "sentiment": "neutral",
-            "confidence": 0.0,
-            "key_points": [],
-            "recommendation_to_salesperson": "Unable to analyze.",
-        }
+        raise
 
 
-def analyze_full_conversation(messages: List[dict]) -> dict:
-    """Analyze the entire conversation for comprehensive insights"""
-    
-    if not messages or len(messages) == 0:
-        return {
-            "sentiment": "neutral",
-            "confidence": 0.5,
-            "key_points": ["No conversation data"],
-            "recommendation_to_salesperson": "No messages to analyze.",
-        }
-    
-    conversation_text = "\n".join([
-        f"{'Customer' if msg['speaker'] == 'user' else 'Agent'}: {msg['text']}"
-        for msg in messages
-    ])
-    
-    if len(conversation_text) > 3000:
-        conversation_text = conversation_text[-3000:]
-    
-    logging.info(f"📝 Conversation text length: {len(conversation_text)} characters")
-    
-    prompt = f"""
-Analyze this complete sales conversation about AI/ML educational courses:
+# -------------------------------------------------------------------
+# ROLLING CONVERSATION SUMMARY
+# -------------------------------------------------------------------
+class RollingSummary:
+    def __init__(self):
+        self.text = ""
+        # number of leading STORE[room_id] lines already folded into text
+        self.covered = 0
+        self.folds = 0
+        self.task: Optional[asyncio.Task] = None
 
-CONVERSATION:
-{conversation_text}
 
-Provide a comprehensive analysis in ONLY valid JSON format (no markdown, no code blocks):
+async def fold_into_summary(previous: str, turns: List[dict]) -> str:
+    prompt = f"""
+Update the running summary of a sales call about AI/ML educational courses.
 
-{{
-  "sentiment": "positive" OR "neutral" OR "negative",
-  "confidence": 0.0 to 1.0,
-  "key_points": ["point1", "point2", "point3"],
-  "customer_interests": ["interest1", "interest2"],
-  "customer_concerns": ["concern1", "concern2"],
-  "recommendation_to_salesperson": "clear actionable recommendation"
-}}
+CURRENT SUMMARY:
+{previous or "(none yet)"}
 
-Analysis Guidelines:
-- sentiment: "positive" if customer is interested/engaged, "negative" if explicitly rejecting/upset, "neutral" if undecided
-- confidence: 0.8+ for clear sentiment, 0.5-0.7 for mixed signals
-- key_points: 3-5 most important things from the ENTIRE conversation
-- customer_interests: what did the customer ask about or show interest in?
-- customer_concerns: what objections or hesitations did they express?
-- recommendation: ONE specific action the salesperson should take next
+NEW TURNS:
+{build_context(turns, CONTEXT_BUDGETS["summary_fold"], CONTEXT_RECENT_TURNS)}
 
-IMPORTANT: Always provide at least 3 key points based on the conversation content.
+Return only the updated summary as plain text, at most {ROLLING_SUMMARY_MAX_WORDS} words.
+Keep the customer's interests, questions, concerns, objections and any commitments.
+Drop greetings and small talk.
 """
+    return await groq_chat(
+        "You maintain concise running summaries of sales conversations. Respond with the summary text only.",
+        prompt,
+        max_tokens=ROLLING_SUMMARY_MAX_WORDS * 2,
+    )
+
+
+def foldable_upto(room_id: str, state: RollingSummary) -> Optional[int]:
+    """End index of the lines to fold next, or None if there aren't enough yet"""
+    upto = len(STORE.get(room_id, ())) - ROLLING_SUMMARY_RECENT_TURNS
+    if ROLLING_SUMMARY_FOLD_TURNS <= 0 or upto - state.covered < ROLLING_SUMMARY_FOLD_TURNS:
+        return None
+    return upto
+
+
+async def fold_room_summary(room_id: str, state: RollingSummary):
+    while ROLLING_SUMMARIES.get(room_id) is state:
+        upto = foldable_upto(room_id, state)
+        if upto is None:
+            return
+        try:
+            text = await fold_into_summary(state.text, STORE[room_id][state.covered:upto])
+        except Exception:
+            # Retried when the next line arrives
+            logging.exception(f"Rolling summary update failed for {room_id}")
+            return
+        state.text, state.covered = text, upto
+        state.folds += 1
+
+
+def update_rolling_summary(room_id: str):
+    """Start folding older lines in the background once enough have piled up"""
+    state = ROLLING_SUMMARIES.setdefault(room_id, RollingSummary())
+    if state.task is not None and not state.task.done():
+        return
+    if foldable_upto(room_id, state) is not None:
+        state.task = asyncio.create_task(fold_room_summary(room_id, state))
+
 
+def discard_rolling_summary(room_id: str):
+    state = ROLLING_SUMMARIES.pop(room_id, None)
+    if state is not None and state.task is not None:
+        state.task.cancel()
+
+# -------------------------------------------------------------------
+# ANALYSIS COALESCING (single-flight per room)
+# -------------------------------------------------------------------
+def store_analysis(room_id: str, analysis_dict: dict, sent_ts: float) -> bool:
+    """Publish an analysis unless a newer message was already analyzed"""
+    if sent_ts < ANALYZED_TS.get(room_id, float("-inf")):
+        return False
+    ANALYZED_TS[room_id] = sent_ts
+    ANALYSIS_STORE[room_id] = analysis_dict
+    room_events.publish(room_id, "analysis", analysis_dict)
+    return True
+
+
+analysis_coalescer = RoomAnalysisCoalescer(
+    analyze_with_groq, store_analysis, cancel_stale=ANALYSIS_CANCEL_STALE
+)
+
+
+async def analyze_user_line(room_id: str, record: dict) -> Optional[dict]:
+    """
+    Publish a local provisional analysis, escalating to the LLM when unsure
+    or due. Trivial lines are not analyzed; the room's previous analysis
+    (if any) is returned instead.
+    """
+    if TRIVIAL_GATE_ENABLED:
+        TRIVIAL_GATE_COUNTS["checked"] += 1
+        if is_trivial_utterance(record["text"]):
+            TRIVIAL_GATE_COUNTS["skipped"] += 1
+            return ANALYSIS_STORE.get(room_id)
+
+    if not LOCAL_SENTIMENT_ENABLED:
+        try:
+            return await analysis_coalescer.submit(room_id, record)
+        except Exception:
+            fallback = copy_analysis(ANALYSIS_FALLBACK)
+            store_analysis(room_id, fallback, record["sent_ts"])
+            return fallback
+
+    provisional = {**score_utterance(record["text"]), "source": "local"}
+    store_analysis(room_id, provisional, record["sent_ts"])
+
+    since_llm = LINES_SINCE_LLM.get(room_id, 0) + 1
+    due = LLM_EVERY_N_USER_LINES > 0 and since_llm >= LLM_EVERY_N_USER_LINES
+    if provisional["confidence"] >= LOCAL_SENTIMENT_MIN_CONFIDENCE and not due:
+        LINES_SINCE_LLM[room_id] = since_llm
+        SENTIMENT_TIER_COUNTS["local"] += 1
+        return provisional
+
+    LINES_SINCE_LLM[room_id] = 0
+    SENTIMENT_TIER_COUNTS["llm"] += 1
     try:
-        logging.info("🤖 Calling Groq API for full conversation analysis...")
-        
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert sales conversation analyst. Always respond with valid JSON only, no markdown or explanations."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.3,
-            max_tokens=1000
-        )
-        
-        logging.info("✅ Groq API responded successfully")
-        
-        raw = response.choices[0].message.content.strip()
-        logging.info(f"📄 Raw response length: {len(raw)} characters")
+        return await analysis_coalescer.submit(room_id, record)
+    except Exception:
+        # LLM unavailable: the provisional stays published
+        return provisional
 
-        if raw.startswith("```"):
-            raw = raw.strip("`")
-            if raw.lower().startswith("json"):
-                raw = raw[4:]
-            raw = raw.strip()
+# -------------------------------------------------------------------
+# ANALYSIS WORKERS
+# -------------------------------------------------------------------
 
-        parsed = json.loads(raw)
-        logging.info("✅ JSON parsed successfully")
+def build_record(payload: TranscriptIn) -> dict:
+    text_clean = payload.text.strip()
+    if not text_clean:
+        raise HTTPException(422, "Empty message")
+    record = {
+        "text": text_clean,
+        "speaker": payload.speaker,
+        "sent_ts": float(payload.timestamp),
+        "received_at": datetime.now(timezone.utc).isoformat(),
+        "room_id": payload.room_id,
+    }
+    if payload.idempotency_key:
+        record["idempotency_key"] = payload.idempotency_key
+    else:
+        record["idempotency_key"] = f"{payload.speaker}:{payload.timestamp!r}"
+        IDEMPOTENCY_COUNTS["derived_keys"] += 1
+    return record
+
+
+def seen_before(record: dict) -> bool:
+    """True if this line's idempotency key was already accepted for its room"""
+    key = record["idempotency_key"]
+    room_id = record["room_id"]
+    keys = RECENT_KEYS.get(room_id)
+    if keys is None:
+        keys = RECENT_KEYS[room_id] = OrderedDict()
+        if len(RECENT_KEYS) > IDEMPOTENCY_MAX_ROOMS:
+            RECENT_KEYS.popitem(last=False)
+    else:
+        RECENT_KEYS.move_to_end(room_id)
+    if key in keys:
+        IDEMPOTENCY_COUNTS["duplicates"] += 1
+        return True
+    keys[key] = None
+    if len(keys) > IDEMPOTENCY_WINDOW:
+        keys.popitem(last=False)
+    IDEMPOTENCY_COUNTS["accepted"] += 1
+    return False
+
+
+def append_to_store(room_id: str, records: List[dict]) -> int:
+    """Append lines to the live room, notify viewers and return the room size"""
+    STORE.setdefault(room_id, []).extend(records)
+    for record in records:
+        room_events.publish(room_id, "message", record)
+    update_rolling_summary(room_id)
+    return len(STORE[room_id])
+
+
+def latest_user_record(records: List[dict]) -> Optional[dict]:
+    """Newest user line, preferring ones that pass the trivial-utterance gate"""
+    user_records = [r for r in records if r["speaker"] == "user"]
+    if TRIVIAL_GATE_ENABLED:
+        user_records = [r for r in user_records if not is_trivial_utterance(r["text"])] or user_records
+    return max(user_records, key=lambda r: r["sent_ts"]) if user_records else None
+
+
+async def handle_transcript_job(job: Job):
+    """
+    Persist one room's queued transcript lines and start the analysis of
+    its latest user line. The job completes without waiting for the LLM,
+    so a few workers never cap how many rooms are analyzed at once; that
+    is bounded by GROQ_MAX_CONCURRENCY and the per-room coalescer.
+    """
+    records = job.payload["records"]
+    message_buffer.add(records)
+
+    latest = latest_user_record(records)
+    if latest is None:
+        return
+    if latest["room_id"] not in STORE:
+        # The call ended (forget_room) before this job ran: the lines are
+        # persisted, but analyzing would re-create state for a finished room
+        return
+
+    task = asyncio.create_task(analyze_in_background(latest))
+    analysis_tasks.add(task)
+    task.add_done_callback(analysis_tasks.discard)
+
+
+async def analyze_in_background(latest: dict):
+    try:
+        analysis_dict = await analyze_user_line(latest["room_id"], latest)
+    except Exception:
+        logging.exception(f"Background analysis for {latest['room_id']} failed")
+        return
+    if analysis_dict is None:
+        return
+    logging.info(
+        f"✅ Background analysis for {latest['room_id']}: "
+        f"{analysis_dict['sentiment']} ({analysis_dict['confidence']:.2f})"
+    )
 
-        all_key_points = []
-        all_key_points.extend(parsed.get("key_points", []))
-        all_key_points.extend(parsed.get("customer_interests", []))
-        all_key_points.extend(parsed.get("customer_concerns", []))
-        
-        logging.info(f"📊 Extracted {len(all_key_points)} key points from analysis")
-        
-        if not all_key_points:
-            logging.warning("⚠️ No key points in Groq response, extracting from messages")
-            user_messages = [m for m in messages if m['speaker'] == 'user']
-            if user_messages:
-                all_key_points = [f"Customer message: {m['text'][:80]}" for m in user_messages[:3]]
-            else:
-                all_key_points = ["Conversation completed"]
 
-        result = {
-            "sentiment": parsed.get("sentiment", "neutral").lower(),
-            "confidence": max(float(parsed.get("confidence", 0.6)), 0.5),
-            "key_points": all_key_points[:7],
-            "recommendation_to_salesperson": parsed.get(
-                "recommendation_to_salesperson",
-                "Follow up based on customer interests expressed in the conversation."
-            ),
-        }
-        
-        logging.info(f"✅ Analysis complete: {result['sentiment']} sentiment with {len(result['key_points'])} key points")
-        return result
-        
-    except json.JSONDecodeError as e:
-        logging.error(f"❌ JSON parse error: {e}")
-        user_messages = [m for m in messages if m['speaker'] == 'user']
-        return {
-            "sentiment": "neutral",
-            "confidence": 0.5,
-            "key_points": [m['text'][:100] for m in user_messages[:5]] if user_messages else ["Customer engaged in conversation"],
-            "recommendation_to_salesperson": "Review full transcript for context and follow up appropriately.",
-        }
-    except Exception as e:
-        logging.error(f"❌ Full conversation analysis error: {type(e).__name__}: {str(e)}")
-        user_messages = [m for m in messages if m['speaker'] == 'user']
-        return {
-            "sentiment": "neutral",
-            "confidence": 0.5,
-            "key_points": [
-                f"Conversation had {len(messages)} total messages",
-                f"Customer spoke {len(user_messages)} times",
-                "See transcript for details"
-            ],
-            "recommendation_to_salesperson": "Review the conversation transcript and follow up based on customer's responses.",
-        }
+async def job_purger():
+    """Expire finished and failed jobs on a timer, however busy the workers are"""
+    while True:
+        await asyncio.sleep(JOB_PURGE_INTERVAL_SECONDS)
+        purged = job_queue.purge(JOB_RETENTION_SECONDS, JOB_FAILED_RETENTION_SECONDS)
+        if purged:
+            logging.info(f"🧹 Purged {purged} old jobs")
+
+
+async def job_worker(kind: str, handler, wakeup: asyncio.Event, max_attempts: int):
+    """Run jobs of one kind from the durable queue, retrying failures with backoff"""
+    while True:
+        wakeup.clear()
+        job = job_queue.claim(kind)
+        if job is None:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=5.0)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            result = await handler(job)
+            job_queue.complete(job.id, result)
+        except asyncio.CancelledError as e:
+            if asyncio.current_task().cancelling():
+                # Worker shutdown: left RUNNING on purpose; recover() requeues it on next start
+                raise
+            # Something the handler awaited was cancelled, not this worker
+            logging.warning(f"{kind} job {job.id} was cancelled (attempt {job.attempts})")
+            retry_in = min(2 ** job.attempts, 60) if job.attempts < max_attempts else None
+            job_queue.fail(job.id, repr(e), retry_in)
+        except Exception as e:
+            logging.exception(f"{kind} job {job.id} failed (attempt {job.attempts})")
+            retry_in = min(2 ** job.attempts, 60) if job.attempts < max_attempts else None
+            job_queue.fail(job.id, str(e), retry_in)
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await database.init()
+    if DASHBOARD_FROM_ROLLUPS and await database.user_stats.is_empty():
+        try:
+            days = await database.user_stats.rebuild_from(database.call_summaries.collection)
+            logging.info(f"📊 Backfilled {days} user_stats rollups from call_summaries")
+        except PyMongoError as e:
+            logging.error(f"❌ user_stats backfill failed (run rebuild_user_stats.py): {e}")
+    message_buffer.start()
+    recovered = job_queue.recover()
+    if recovered:
+        logging.info(f"♻️ Requeued {recovered} unfinished jobs")
+    for _ in range(ANALYSIS_WORKERS):
+        worker_tasks.append(asyncio.create_task(job_worker(
+            TRANSCRIPT_JOB, handle_transcript_job, job_wakeup, ANALYSIS_MAX_ATTEMPTS
+        )))
+    for _ in range(END_CALL_WORKERS):
+        worker_tasks.append(asyncio.create_task(job_worker(
+            END_CALL_JOB, handle_end_call_job, end_call_wakeup, END_CALL_MAX_ATTEMPTS
+        )))
+    worker_tasks.append(asyncio.create_task(job_purger()))
+    logging.info(
+        f"🧵 Started {ANALYSIS_WORKERS} analysis workers (mode={ANALYSIS_MODE}) "
+        f"and {END_CALL_WORKERS} end-call workers"
+    )
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in worker_tasks:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    worker_tasks.clear()
+    for task in analysis_tasks:
+        task.cancel()
+    await asyncio.gather(*analysis_tasks, return_exceptions=True)
+    job_queue.close()
+    await message_buffer.close()
+    await database.close()
 
 # -------------------------------------------------------------------
 # PROCESS TRANSCRIPTION
 # -------------------------------------------------------------------
 @app.post("/process-transcription", response_model=TranscriptResponse)
-async def process_transcription(payload: TranscriptIn):
+async def process_transcription(payload: TranscriptIn, response: Response):
     try:
-        text_clean = payload.text.strip()
-        if not text_clean:
-            raise HTTPException(422, "Empty message")
-
-        record = {
-            "text": text_clean,
-            "speaker": payload.speaker,
-            "sent_ts": float(payload.timestamp),
-            "received_at": datetime.now(timezone.utc).isoformat(),
-            "room_id": payload.room_id,
-        }
+        record = build_record(payload)
+        text_clean = record["text"]
+
+        if seen_before(record):
+            return TranscriptResponse(
+                ok=True,
+                room_id=payload.room_id,
+                count_in_room=len(STORE.get(payload.room_id, [])),
+                duplicate=True,
+            )
 
-        STORE.setdefault(payload.room_id, []).append(record)
+        append_to_store(payload.room_id, [record])
+
+        if ANALYSIS_MODE == "background":
+            job_queue.put(TRANSCRIPT_JOB, {"records": [record]})
+            job_wakeup.set()
+            response.status_code = status.HTTP_202_ACCEPTED
+            return TranscriptResponse(
+                ok=True,
+                room_id=payload.room_id,
+                count_in_room=len(STORE[payload.room_id]),
+                latest_user_message=text_clean if payload.speaker == "user" else None,
+                queued=True,
+            )
 
-        try:
-            messages_collection.insert_one(record.copy())
-        except PyMongoError as e:
-            logging.error(f"Mongo insert failed: {e}")
+        message_buffer.add([record])
 
         analysis_obj = None
         latest_user_message = None
 
         if payload.speaker == "user":
             latest_user_message = text_clean
-            analysis_dict = analyze_with_groq(text_clean)
-            ANALYSIS_STORE[payload.room_id] = analysis_dict
-            analysis_obj = SentimentAnalysis(**analysis_dict)
-            
-            logging.info(
-                f"✅ Analysis: {analysis_obj.sentiment} "
-                f"({analysis_obj.confidence:.2f}) - {analysis_obj.recommendation_to_salesperson}"
-            )
+            analysis_dict = await analyze_user_line(payload.room_id, record)
+            if analysis_dict is not None:
+                analysis_obj = SentimentAnalysis(**analysis_dict)
+
+                logging.info(
+                    f"✅ Analysis: {analysis_obj.sentiment} "
+                    f"({analysis_obj.confidence:.2f}) - {analysis_obj.recommendation_to_salesperson}"
+                )
 
         return TranscriptResponse(
             ok=True,
@@ -1479,10 +1888,94 @@ async def process_transcription(payload: TranscriptIn):
             latest_user_message=latest_user_message,
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.exception("Processing error")
         raise HTTPException(500, str(e))
 
+# -------------------------------------------------------------------
+# PROCESS TRANSCRIPTION (BATCH)
+# -------------------------------------------------------------------
+@app.post("/process-transcription/batch", response_model=BatchTranscriptResponse)
+async def process_transcription_batch(
+    payloads: List[TranscriptIn],
+    response: Response,
+    wait_for_analysis: bool = Query(True),
+):
+    """
+    Ingest buffered or replayed lines, possibly spanning several rooms.
+    wait_for_analysis=false queues the analysis like background mode, so a
+    sender that only needs delivery isn't held up by the LLM round trip.
+    """
+    try:
+        if not payloads:
+            raise HTTPException(422, "Empty batch")
+
+        by_room: Dict[str, List[dict]] = {}
+        duplicates = 0
+        # Validate the whole batch before any key is marked as seen
+        for record in [build_record(payload) for payload in payloads]:
+            if seen_before(record):
+                duplicates += 1
+                continue
+            by_room.setdefault(record["room_id"], []).append(record)
+
+        for room_id, records in by_room.items():
+            records.sort(key=lambda r: r["sent_ts"])
+            append_to_store(room_id, records)
+
+        counts = {p.room_id: len(STORE.get(p.room_id, [])) for p in payloads}
+
+        if ANALYSIS_MODE == "background" or not wait_for_analysis:
+            for records in by_room.values():
+                job_queue.put(TRANSCRIPT_JOB, {"records": records})
+            job_wakeup.set()
+            response.status_code = status.HTTP_202_ACCEPTED
+            return BatchTranscriptResponse(
+                ok=True,
+                accepted=len(payloads) - duplicates,
+                count_in_room=counts,
+                queued=True,
+                duplicates=duplicates,
+            )
+
+        message_buffer.add([r for records in by_room.values() for r in records])
+
+        latest_by_room = {
+            room_id: latest
+            for room_id, records in by_room.items()
+            if (latest := latest_user_record(records)) is not None
+        }
+        results = await asyncio.gather(
+            *(analyze_user_line(room_id, r) for room_id, r in latest_by_room.items())
+        )
+
+        analyses = {
+            room_id: SentimentAnalysis(**analysis_dict)
+            for room_id, analysis_dict in zip(latest_by_room, results)
+            if analysis_dict is not None
+        }
+
+        logging.info(
+            f"📦 Batch of {len(payloads)} lines across {len(by_room)} rooms, "
+            f"{len(analyses)} analyses"
+        )
+
+        return BatchTranscriptResponse(
+            ok=True,
+            accepted=len(payloads) - duplicates,
+            count_in_room=counts,
+            analysis=analyses,
+            duplicates=duplicates,
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.exception("Batch processing error")
+        raise HTTPException(500, str(e))
+
 # -------------------------------------------------------------------
 # GET LATEST ANALYSIS FOR A ROOM
 # -------------------------------------------------------------------
@@ -1508,6 +2001,106 @@ async def get_latest_analysis(room_id: str):
         logging.exception("Error fetching analysis")
         raise HTTPException(500, str(e))
 
+# -------------------------------------------------------------------
+# LIVE ROOM PUSH (WEBSOCKET)
+# -------------------------------------------------------------------
+def room_snapshot(room_id: str, limit: int = 60) -> dict:
+    return {
+        "messages": STORE.get(room_id, [])[-limit:],
+        "analysis": ANALYSIS_STORE.get(room_id),
+    }
+
+
+@app.websocket("/ws/rooms/{room_id}")
+async def room_updates_ws(websocket: WebSocket, room_id: str):
+    """Push new messages and analyses for a room as they are produced"""
+    await websocket.accept()
+    subscription = room_events.subscribe(room_id)
+    try:
+        await websocket.send_json({"type": "snapshot", "room_id": room_id, "data": room_snapshot(room_id)})
+        while True:
+            event = await subscription.get(timeout=ROOM_PUSH_HEARTBEAT_SECONDS)
+            if subscription.lagged:
+                # Viewer fell behind; it reconnects and starts from a fresh snapshot
+                await websocket.close(code=1013)
+                return
+            await websocket.send_json(event or {"type": "ping", "room_id": room_id})
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logging.exception(f"Room push error for {room_id}")
+    finally:
+        room_events.unsubscribe(subscription)
+
+# -------------------------------------------------------------------
+# LIVE ROOM STREAM (SERVER-SENT EVENTS)
+# -------------------------------------------------------------------
+def sse_event(event_type: str, data, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {room_events.epoch}:{event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    """Sequence number from an `<epoch>:<seq>` id issued by this process"""
+    if not value:
+        return None
+    epoch, _, seq = value.partition(":")
+    if epoch != room_events.epoch or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+@app.get("/analysis/{room_id}/stream")
+async def stream_room_analysis(
+    room_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Query(None),
+):
+    """SSE stream of new messages and analyses for a room, resumable via Last-Event-ID"""
+    resume_from = parse_last_event_id(request.headers.get("last-event-id") or last_event_id)
+
+    async def event_stream():
+        subscription = room_events.subscribe(room_id)
+        try:
+            backlog = room_events.replay(room_id, resume_from) if resume_from is not None else None
+            if backlog is None:
+                # Fresh viewer, or resuming past what we still remember
+                last_sent = room_events.last_id
+                yield "retry: 3000\n" + sse_event("snapshot", room_snapshot(room_id), last_sent)
+            else:
+                last_sent = resume_from
+                yield "retry: 3000\n\n"
+                for event in backlog:
+                    last_sent = event["id"]
+                    yield sse_event(event["type"], event["data"], event["id"])
+
+            while True:
+                event = await subscription.get(timeout=ROOM_PUSH_HEARTBEAT_SECONDS)
+                if subscription.lagged:
+                    # Ending the response makes EventSource reconnect and resume
+                    return
+                if event is None:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["id"] <= last_sent:
+                    continue
+                last_sent = event["id"]
+                yield sse_event(event["type"], event["data"], event["id"])
+        finally:
+            room_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # -------------------------------------------------------------------
 # GET MESSAGES FOR A ROOM
 # -------------------------------------------------------------------
@@ -1519,12 +2112,7 @@ async def get_messages(room_id: str, limit: int = Query(50, ge=1, le=500)):
         
         if len(messages) < limit:
             try:
-                mongo_messages = list(
-                    messages_collection
-                    .find({"room_id": room_id}, {"_id": 0})
-                    .sort("sent_ts", DESCENDING)
-                    .limit(limit)
-                )
+                mongo_messages = await database.messages.recent_for_room(room_id, limit)
                 all_messages = messages + mongo_messages
                 all_messages.sort(key=lambda x: x.get("sent_ts", 0))
                 messages = all_messages[-limit:] if len(all_messages) > limit else all_messages
@@ -1540,6 +2128,266 @@ async def get_messages(room_id: str, limit: int = Query(50, ge=1, le=500)):
         logging.exception("Error fetching messages")
         raise HTTPException(500, str(e))
 
+# -------------------------------------------------------------------
+# END-OF-CALL ANALYSIS (one LLM pass for /save-session and /end-call)
+# -------------------------------------------------------------------
+CALL_SUMMARY_FALLBACK = {"summary": "", "callPurpose": "", "userExperience": "Neutral"}
+# room_id -> (message count, task) of the room's latest end-of-call pass
+END_OF_CALL_PASSES: Dict[str, Tuple[int, asyncio.Task]] = {}
+
+
+async def summarize_call_notes(context: str, part: str) -> str:
+    """Map step: condense one transcript window (or a group of notes) into short notes"""
+    prompt = f"""
+Summarize {part} of a SALES CALL about AI/ML educational courses
+in at most {CALL_SUMMARY_NOTE_WORDS} words of plain text.
+Keep the customer's interests, questions, concerns, objections, tone and any commitments.
+
+{context}
+"""
+    return await groq_chat(
+        "You are a sales call summarizer. Respond with the summary text only.",
+        prompt,
+        max_tokens=CALL_SUMMARY_NOTE_WORDS * 2,
+    )
+
+
+def group_by_tokens(notes: List[str], budget: int) -> List[List[str]]:
+    groups: List[List[str]] = []
+    group: List[str] = []
+    used = 0
+    for note in notes:
+        cost = count_tokens(note)
+        if group and used + cost > budget:
+            groups.append(group)
+            group, used = [], 0
+        group.append(note)
+        used += cost
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def condense_call(messages: List[dict], summary: str, summarized: int) -> Tuple[str, str]:
+    """
+    Conversation context for the end-of-call prompt within the "end_call"
+    budget, and what it is. Uses the rolling summary plus the remaining
+    turns when there is one, the transcript itself when it fits, and
+    otherwise notes on consecutive windows summarized concurrently (at most
+    CALL_SUMMARY_CONCURRENCY at once).
+    """
+    budget = CONTEXT_BUDGETS["end_call"]
+    if summary:
+        recent = build_context(messages[summarized:], budget - count_tokens(summary), CONTEXT_RECENT_TURNS)
+        context = (
+            f"SUMMARY OF EARLIER CONVERSATION ({summarized} messages):\n{summary}\n\n"
+            f"RECENT TURNS:\n{recent}"
+        )
+        return context, "this complete sales conversation"
+
+    chunks = chunk_messages(messages, budget)
+    if len(chunks) == 1:
+        return build_context(messages, budget, CONTEXT_RECENT_TURNS), "this complete sales conversation"
+
+    limiter = asyncio.Semaphore(CALL_SUMMARY_CONCURRENCY)
+
+    async def limited(context: str, part: str) -> str:
+        async with limiter:
+            return await summarize_call_notes(context, part)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            limited(build_context(chunk, budget, len(chunk)), f"part {i + 1} of {len(chunks)}")
+            for i, chunk in enumerate(chunks)
+        ),
+        return_exceptions=True,
+    )
+    notes = [f"Part {i + 1}: {n}" for i, n in enumerate(results) if not isinstance(n, BaseException)]
+    if len(notes) < len(chunks):
+        failed = next(n for n in results if isinstance(n, BaseException))
+        if not notes:
+            raise failed
+        logging.error(f"{len(chunks) - len(notes)}/{len(chunks)} call summary chunks failed: {failed!r}")
+
+    # Very long calls: keep condensing groups of notes until they fit
+    while count_tokens("\n\n".join(notes)) > budget and len(notes) > 1:
+        groups = group_by_tokens(notes, budget)
+        if len(groups) == len(notes):
+            break
+        notes = await asyncio.gather(
+            *(limited("\n\n".join(group), "these consecutive notes") for group in groups)
+        )
+
+    logging.info(
+        f"🧩 Condensed {len(messages)} messages from {len(chunks)} chunks "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+    return (
+        truncate_to_tokens("\n\n".join(notes), budget),
+        "these notes, in order, on consecutive parts of a sales conversation",
+    )
+
+
+async def analyze_finished_call(messages: List[dict], summary: str = "", summarized: int = 0) -> Tuple[dict, dict]:
+    """
+    Analyze the entire conversation and summarize the call in a single LLM
+    request. Returns (session analysis, call summary fields). Raises on
+    Groq or JSON errors; see end_of_call_pass for the fallbacks.
+    """
+    context, source = await condense_call(messages, summary, summarized)
+    logging.info(f"📝 End-of-call context: ~{count_tokens(context)} tokens")
+
+    prompt = f"""
+Analyze {source} about AI/ML educational courses:
+
+CONVERSATION:
+{context}
+
+Provide a comprehensive analysis and call summary in ONLY valid JSON format (no markdown, no code blocks):
+
+{{
+  "sentiment": "positive" OR "neutral" OR "negative",
+  "confidence": 0.0 to 1.0,
+  "key_points": ["point1", "point2", "point3"],
+  "customer_interests": ["interest1", "interest2"],
+  "customer_concerns": ["concern1", "concern2"],
+  "recommendation_to_salesperson": "clear actionable recommendation",
+  "summary": "short summary of the call",
+  "callPurpose": "why the call took place",
+  "userExperience": "Positive" OR "Neutral" OR "Negative"
+}}
+
+Analysis Guidelines:
+- sentiment: "positive" if customer is interested/engaged, "negative" if explicitly rejecting/upset, "neutral" if undecided
+- confidence: 0.8+ for clear sentiment, 0.5-0.7 for mixed signals
+- key_points: 3-5 most important things from the ENTIRE conversation
+- customer_interests: what did the customer ask about or show interest in?
+- customer_concerns: what objections or hesitations did they express?
+- recommendation: ONE specific action the salesperson should take next
+- userExperience: only Positive, Neutral, or Negative based on the customer's tone and engagement, no other text
+
+IMPORTANT: Always provide at least 3 key points based on the conversation content.
+"""
+
+    logging.info("🤖 Calling Groq API for end-of-call analysis...")
+    raw = await groq_chat(
+        "You are an expert sales conversation analyst. Always respond with valid JSON only, no markdown or explanations.",
+        prompt,
+        max_tokens=1200,
+    )
+    logging.info(f"✅ Groq API responded ({len(raw)} characters)")
+
+    if raw.startswith("```"):
+        raw = raw.strip("`")
+        if raw.lower().startswith("json"):
+            raw = raw[4:]
+        raw = raw.strip()
+
+    parsed = json.loads(raw)
+
+    all_key_points = []
+    all_key_points.extend(parsed.get("key_points", []))
+    all_key_points.extend(parsed.get("customer_interests", []))
+    all_key_points.extend(parsed.get("customer_concerns", []))
+
+    if not all_key_points:
+        logging.warning("⚠️ No key points in Groq response, extracting from messages")
+        user_messages = [m for m in messages if m['speaker'] == 'user']
+        if user_messages:
+            all_key_points = [f"Customer message: {m['text'][:80]}" for m in user_messages[:3]]
+        else:
+            all_key_points = ["Conversation completed"]
+
+    analysis = {
+        "sentiment": parsed.get("sentiment", "neutral").lower(),
+        "confidence": max(float(parsed.get("confidence", 0.6)), 0.5),
+        "key_points": all_key_points[:7],
+        "recommendation_to_salesperson": parsed.get(
+            "recommendation_to_salesperson",
+            "Follow up based on customer interests expressed in the conversation."
+        ),
+    }
+    summary_data = {
+        "summary": parsed.get("summary", ""),
+        "callPurpose": parsed.get("callPurpose", ""),
+        "userExperience": parsed.get("userExperience", "Neutral"),
+    }
+
+    logging.info(
+        f"✅ Analysis complete: {analysis['sentiment']} sentiment with "
+        f"{len(analysis['key_points'])} key points, experience {summary_data['userExperience']}"
+    )
+    return analysis, summary_data
+
+
+def fallback_call_analysis(messages: List[dict], parse_error: bool) -> dict:
+    user_messages = [m for m in messages if m['speaker'] == 'user']
+    if parse_error:
+        return {
+            "sentiment": "neutral",
+            "confidence": 0.5,
+            "key_points": [m['text'][:100] for m in user_messages[:5]] if user_messages else ["Customer engaged in conversation"],
+            "recommendation_to_salesperson": "Review full transcript for context and follow up appropriately.",
+        }
+    return {
+        "sentiment": "neutral",
+        "confidence": 0.5,
+        "key_points": [
+            f"Conversation had {len(messages)} total messages",
+            f"Customer spoke {len(user_messages)} times",
+            "See transcript for details"
+        ],
+        "recommendation_to_salesperson": "Review the conversation transcript and follow up based on customer's responses.",
+    }
+
+
+async def end_of_call_pass(room_id: str, messages: List[dict], fallback: bool = True) -> Tuple[dict, dict]:
+    """
+    Session analysis and call summary for a room. Concurrent or repeated
+    callers (/save-session from the UI, the end-call job) share one LLM
+    request as long as no new message arrived in between. Failures are not
+    cached; they return placeholder results, or raise if `fallback` is off.
+    """
+    entry = END_OF_CALL_PASSES.get(room_id)
+    if entry is None or entry[0] != len(messages):
+        rolling = ROLLING_SUMMARIES.get(room_id) or RollingSummary()
+        task = asyncio.create_task(analyze_finished_call(list(messages), rolling.text, rolling.covered))
+        entry = END_OF_CALL_PASSES[room_id] = (len(messages), task)
+
+    try:
+        return await asyncio.shield(entry[1])
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if END_OF_CALL_PASSES.get(room_id) is entry:
+            END_OF_CALL_PASSES.pop(room_id)
+        if not fallback:
+            raise
+        parse_error = isinstance(e, json.JSONDecodeError)
+        if parse_error:
+            logging.error(f"❌ JSON parse error: {e}")
+        else:
+            logging.error(f"❌ End-of-call analysis error: {type(e).__name__}: {str(e)}")
+        return fallback_call_analysis(messages, parse_error), dict(CALL_SUMMARY_FALLBACK)
+
+
+async def save_transcript(room_id: str, messages: List[dict], analysis: dict) -> str:
+    """Insert or refresh the room's transcripts document and return its id"""
+    rolling = ROLLING_SUMMARIES.get(room_id)
+    fields = {
+        "messages": messages,
+        "total_messages": len(messages),
+        "latest_analysis": analysis,
+        "rolling_summary": rolling.text if rolling else "",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    existing_session = await database.transcripts.get(room_id, {"_id": 1})
+    if existing_session:
+        await database.transcripts.update(room_id, fields)
+        return str(existing_session["_id"])
+    return await database.transcripts.insert({"session_id": room_id, **fields})
+
 # -------------------------------------------------------------------
 # SAVE SESSION
 # -------------------------------------------------------------------
@@ -1547,7 +2395,7 @@ async def get_messages(room_id: str, limit: int = Query(50, ge=1, le=500)):
 async def save_session(room_id: str = Query(...)):
     try:
         if room_id not in STORE:
-            existing = sessions_collection.find_one({"session_id": room_id})
+            existing = await database.transcripts.get(room_id)
             if existing:
                 return SaveSessionResponse(
                     ok=True,
@@ -1558,34 +2406,9 @@ async def save_session(room_id: str = Query(...)):
             raise HTTPException(404, "Room not found in memory or database")
 
         messages = STORE[room_id]
-        existing_session = sessions_collection.find_one({"session_id": room_id})
-        
         logging.info(f"🔍 Analyzing full conversation with {len(messages)} messages")
-        full_analysis = analyze_full_conversation(messages)
-        
-        if existing_session:
-            sessions_collection.update_one(
-                {"session_id": room_id},
-                {
-                    "$set": {
-                        "messages": messages,
-                        "total_messages": len(messages),
-                        "latest_analysis": full_analysis,
-                        "timestamp": datetime.now(timezone.utc).isoformat(),
-                    }
-                }
-            )
-            mongo_id = str(existing_session["_id"])
-        else:
-            session_doc = {
-                "session_id": room_id,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "messages": messages,
-                "total_messages": len(messages),
-                "latest_analysis": full_analysis,
-            }
-            result = sessions_collection.insert_one(session_doc)
-            mongo_id = str(result.inserted_id)
+        full_analysis, _ = await end_of_call_pass(room_id, messages)
+        mongo_id = await save_transcript(room_id, messages, full_analysis)
 
         logging.info(f"💾 Session {room_id} saved with {len(messages)} messages")
 
@@ -1605,37 +2428,51 @@ async def save_session(room_id: str = Query(...)):
 # -------------------------------------------------------------------
 # END CALL — SAVE SUMMARY
 # -------------------------------------------------------------------
-@app.post("/end-call")
-async def end_call(
-    room_id: str = Query(...), 
-    phone_number: Optional[str] = Query(None), 
-    userId: str = Query(...)
-):
-    """End call and create comprehensive summary"""
-    # Avoid duplicates
-    existing = call_summaries_collection.find_one({"room_id": room_id})
-    if existing:
-        return {
-            "ok": True,
-            "message": "Summary already exists.",
-            "duration": existing.get("duration")
-        }
+def forget_room(room_id: str):
+    """Drop all in-memory state of a finished room"""
+    # Callers still waiting on an analysis get the room's last one
+    analysis_coalescer.discard(room_id, ANALYSIS_STORE.get(room_id))
+    STORE.pop(room_id, None)
+    ANALYSIS_STORE.pop(room_id, None)
+    ANALYZED_TS.pop(room_id, None)
+    LINES_SINCE_LLM.pop(room_id, None)
+    discard_rolling_summary(room_id)
+    END_OF_CALL_PASSES.pop(room_id, None)
+    room_events.forget(room_id)
 
-    messages = STORE.get(room_id, [])
-    if not messages:
-        # Try DB fallback with prefix match
-        try:
-            messages = list(
-                messages_collection
-                .find({"room_id": {"$regex": f"^{room_id}"}}, {"_id": 0})
-                .sort("sent_ts", 1)
-            )
-        except Exception as e:
-            logging.error(f"Failed to fetch messages from DB: {e}")
-            messages = []
 
-    if not messages:
-        raise HTTPException(404, "No messages found")
+def invalidate_dashboard(user_id: str) -> int:
+    """Forget every cached dashboard response for one user"""
+    DASHBOARD_GENERATIONS[user_id] = DASHBOARD_GENERATIONS.get(user_id, 0) + 1
+    return dashboard_cache.invalidate_where(lambda key: key[0] == user_id)
+
+
+def cache_dashboard(key: tuple, value: dict, generation: int):
+    """Cache a dashboard response unless the user was invalidated while it was computed"""
+    if DASHBOARD_GENERATIONS.get(key[0], 0) == generation:
+        dashboard_cache.set(key, value)
+
+
+async def roll_up_call(doc: dict):
+    """Add a stored call summary to its user's daily rollup (idempotent)"""
+    await database.user_stats.record_call(doc)
+    await database.call_summaries.mark_rolled_up(doc["room_id"])
+
+
+async def handle_end_call_job(job: Job) -> dict:
+    """Analyze a finished call once, store its transcript and summary, release the room"""
+    room_id = job.payload["room_id"]
+    userId = job.payload["userId"]
+    messages = job.payload["messages"]
+
+    # A previous attempt may have inserted the summary before dying
+    existing = await database.call_summaries.get_by_room(room_id)
+    if existing:
+        if not existing.get("rolledUp"):
+            await roll_up_call(existing)
+        invalidate_dashboard(existing["userId"])
+        forget_room(room_id)
+        return {"mongo_id": str(existing["_id"]), "duration": existing.get("duration")}
 
     # Compute duration
     try:
@@ -1646,53 +2483,15 @@ async def end_call(
         duration_seconds = 0
     duration_mmss = f"{duration_seconds//60}:{duration_seconds%60:02d}"
 
-    transcript = "\n".join([f"{m['speaker']}: {m['text']}" for m in messages])
-
-    # Groq Summary
-    try:
-        prompt = f"""
-Summarize this SALES CALL:
-I want you to give the value of userExperience only as Positive, Neutral, or Negative based on the customer's tone and engagement..no other text.
-
-{transcript}
-
-Return ONLY JSON:
-{{
-  "summary": "",
-  "callPurpose": "",
-  "userExperience": ""
-}}
-"""
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a sales call summarizer. Always respond with valid JSON only, no markdown or explanations."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.3,
-            max_tokens=500
-        )
-        
-        raw = response.choices[0].message.content.strip()
-        raw = raw.replace("```json", "").replace("```", "").strip()
-        summary_data = json.loads(raw)
-    except Exception as e:
-        logging.error(f"Groq summary error: {e}")
-        summary_data = {
-            "summary": "", 
-            "callPurpose": "", 
-            "userExperience": "Neutral"
-        }
+    # Let the queue retry LLM failures; store placeholders on the last attempt
+    full_analysis, summary_data = await end_of_call_pass(
+        room_id, messages, fallback=job.attempts >= END_CALL_MAX_ATTEMPTS
+    )
+    await save_transcript(room_id, messages, full_analysis)
 
     # Lookup user for email / phone fallback
-    user = users_collection.find_one({"_id": userId})
-    saved_phone = phone_number or (user.get("phone_number") if user else None)
+    user = await database.users.get_by_id(userId)
+    saved_phone = job.payload.get("phone_number") or (user.get("phone_number") if user else None)
 
     doc = {
         "room_id": room_id,
@@ -1704,21 +2503,96 @@ Return ONLY JSON:
         "userExperience": summary_data.get("userExperience", "Neutral"),
         "phoneNumber": saved_phone,
         "duration": {"seconds": int(duration_seconds), "mmss": duration_mmss},
-        "callDate": datetime.now(timezone.utc).isoformat(),
-        "createdAt": datetime.now(timezone.utc).isoformat(),
-        "totalMessages": len(messages)
+        # Native BSON dates so (userId, callDate) index range scans and sorts work
+        "callDate": datetime.now(timezone.utc),
+        "createdAt": datetime.now(timezone.utc),
+        "totalMessages": len(messages),
+        "rolledUp": False,
     }
 
-    result = call_summaries_collection.insert_one(doc)
+    mongo_id = await database.call_summaries.insert(doc)
+    await database.rooms.mark_ended(room_id)
+    await roll_up_call(doc)
+    invalidate_dashboard(userId)
+    logging.info(f"📋 Call summary for {room_id} saved ({len(messages)} messages)")
 
-    # Cleanup memory
-    STORE.pop(room_id, None)
-    ANALYSIS_STORE.pop(room_id, None)
+    room_events.publish(room_id, "ended", {"duration": doc["duration"]})
+    forget_room(room_id)
+    return {"mongo_id": mongo_id, "duration": doc["duration"]}
+
+
+@app.post("/end-call")
+async def end_call(
+    response: Response,
+    room_id: str = Query(...), 
+    phone_number: Optional[str] = Query(None), 
+    userId: str = Query(...)
+):
+    """End call: queue the summary job and return right away (see /end-call/{room_id}/status)"""
+    if room_id not in STORE:
+        # Accept the short room name too; continue with the canonical one
+        room = await database.rooms.resolve(room_id, userId)
+        if room is not None:
+            room_id = room["_id"]
 
+    # Avoid duplicates
+    existing = await database.call_summaries.get_by_room(room_id)
+    if existing:
+        return {
+            "ok": True,
+            "message": "Summary already exists.",
+            "duration": existing.get("duration")
+        }
+
+    job = job_queue.status(END_CALL_JOB, room_id)
+    if job is not None and job["status"] in (PENDING, RUNNING):
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"ok": True, "queued": True, "room_id": room_id, "status": job["status"]}
+
+    messages = STORE.get(room_id, [])
+    if not messages:
+        # Already flushed (e.g. after a restart): indexed lookup by canonical id
+        try:
+            messages = await database.messages.for_room(room_id)
+        except Exception as e:
+            logging.error(f"Failed to fetch messages from DB: {e}")
+            messages = []
+
+    if not messages:
+        raise HTTPException(404, "No messages found")
+
+    payload = {
+        "room_id": room_id,
+        "userId": userId,
+        "phone_number": phone_number,
+        "messages": messages,
+    }
+    if job_queue.put(END_CALL_JOB, payload, key=room_id) is None:
+        # An earlier job for this room gave up; start it over with fresh data
+        if not job_queue.retry_failed(END_CALL_JOB, room_id, payload):
+            logging.warning(f"End-call job for {room_id} already finished without a summary")
+    end_call_wakeup.set()
+
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {"ok": True, "queued": True, "room_id": room_id, "status": PENDING}
+
+
+@app.get("/end-call/{room_id}/status")
+async def end_call_status(room_id: str):
+    """Progress of a room's end-call job"""
+    job = job_queue.status(END_CALL_JOB, room_id)
+    if job is None:
+        summary = await database.call_summaries.get_by_room(room_id, {"_id": 1})
+        if summary is None:
+            raise HTTPException(404, "No end-call job for this room")
+        return {"room_id": room_id, "status": "done", "mongo_id": str(summary["_id"])}
     return {
-        "ok": True,
-        "mongo_id": str(result.inserted_id),
-        "duration": doc["duration"]
+        "room_id": room_id,
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "last_error": job["last_error"],
+        "result": job["result"],
+        "updated_at": datetime.fromtimestamp(job["updated_at"], timezone.utc).isoformat(),
     }
 
 # -------------------------------------------------------------------
@@ -1727,111 +2601,94 @@ Return ONLY JSON:
 @app.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user_dep)):
     """Get dynamic dashboard statistics for the current user"""
+    userId = current_user["_id"]
+    cached = dashboard_cache.get((userId, "stats"))
+    if cached is not None:
+        return cached
+    generation = DASHBOARD_GENERATIONS.get(userId, 0)
     try:
-        userId = current_user["_id"]
-        
-        # Query filter for current user
-        query_filter = {"userId": userId}
-        
-        # Total calls count
-        total_calls = call_summaries_collection.count_documents(query_filter)
-        
-        # Get all calls for this user
-        all_calls = list(call_summaries_collection.find(query_filter, {"_id": 0}))
-        
-        # Calculate success rate (Positive / Total)
-        if total_calls > 0:
-            positive_calls = sum(1 for c in all_calls if c.get("userExperience") == "Positive")
-            success_rate = round((positive_calls / total_calls) * 100)
-        else:
-            success_rate = 0
-        
-        # Active users is always 1 for user-specific view
-        active_users = 1
-        
-        # Calculate average rating
-        if total_calls > 0:
-            rating_map = {"Positive": 5, "Neutral": 3, "Negative": 2}
-            total_rating = sum(rating_map.get(c.get("userExperience", "Neutral"), 3) for c in all_calls)
-            avg_rating = round(total_rating / total_calls, 1)
-        else:
-            avg_rating = 0.0
-        
-        # Get previous period stats for trends (last 30 days vs previous 30 days)
-        from datetime import timedelta
+        # Last 30 days vs previous 30 days, all computed server-side
         now = datetime.now(timezone.utc)
         thirty_days_ago = now - timedelta(days=30)
         sixty_days_ago = now - timedelta(days=60)
-        
-        # Current period
-        current_period_filter = {**query_filter, "callDate": {"$gte": thirty_days_ago.isoformat()}}
-        current_calls = call_summaries_collection.count_documents(current_period_filter)
-        
-        # Previous period
-        previous_period_filter = {
-            **query_filter, 
-            "callDate": {
-                "$gte": sixty_days_ago.isoformat(),
-                "$lt": thirty_days_ago.isoformat()
-            }
-        }
-        previous_calls = call_summaries_collection.count_documents(previous_period_filter)
-        
-        # Calculate trend
-        if previous_calls > 0:
-            calls_trend = round(((current_calls - previous_calls) / previous_calls) * 100)
-        else:
-            calls_trend = 100 if current_calls > 0 else 0
-        
-        # Success rate trend
-        current_positive = call_summaries_collection.count_documents({
-            **query_filter,
-            "callDate": {"$gte": thirty_days_ago.isoformat()},
-            "userExperience": "Positive"
-        })
-        current_success_rate = round((current_positive / current_calls) * 100) if current_calls > 0 else 0
-        
-        previous_positive = call_summaries_collection.count_documents({
-            **query_filter,
-            "callDate": {
-                "$gte": sixty_days_ago.isoformat(),
-                "$lt": thirty_days_ago.isoformat()
-            },
-            "userExperience": "Positive"
-        })
-        previous_success_rate = round((previous_positive / previous_calls) * 100) if previous_calls > 0 else 0
-        
-        success_trend = current_success_rate - previous_success_rate
-        
-        # Calculate rating trend
-        if current_calls > 0 and previous_calls > 0:
-            current_calls_data = list(call_summaries_collection.find(current_period_filter, {"userExperience": 1}))
-            previous_calls_data = list(call_summaries_collection.find(previous_period_filter, {"userExperience": 1}))
-            
-            rating_map = {"Positive": 5, "Neutral": 3, "Negative": 2}
-            current_avg = sum(rating_map.get(c.get("userExperience", "Neutral"), 3) for c in current_calls_data) / len(current_calls_data)
-            previous_avg = sum(rating_map.get(c.get("userExperience", "Neutral"), 3) for c in previous_calls_data) / len(previous_calls_data)
-            rating_trend = round(current_avg - previous_avg, 1)
+        if DASHBOARD_FROM_ROLLUPS:
+            # Day granularity: O(days) small documents per user
+            current_day = thirty_days_ago.date().isoformat()
+            previous_day = sixty_days_ago.date().isoformat()
+            windows = await database.user_stats.window_totals(
+                userId,
+                {
+                    "all": (None, None),
+                    "current": (current_day, None),
+                    "previous": (previous_day, current_day),
+                },
+            )
         else:
-            rating_trend = 0.0
-        
-        return {
-            "total_calls": total_calls,
-            "success_rate": success_rate,
-            "active_users": active_users,
-            "avg_rating": avg_rating,
-            "trends": {
-                "calls": f"+{calls_trend}%" if calls_trend >= 0 else f"{calls_trend}%",
-                "success_rate": f"+{success_trend}%" if success_trend >= 0 else f"{success_trend}%",
-                "users": "+0%",  # Always 0 for single user view
-                "rating": f"+{rating_trend}" if rating_trend >= 0 else f"{rating_trend}"
-            }
-        }
-    
+            windows = await database.call_summaries.window_totals(
+                userId,
+                {
+                    "all": {},
+                    "current": {"$gte": thirty_days_ago},
+                    "previous": {"$gte": sixty_days_ago, "$lt": thirty_days_ago},
+                },
+            )
+        stats = dashboard_stats_from(windows)
+        cache_dashboard((userId, "stats"), stats, generation)
+        return stats
+
     except Exception as e:
         logging.exception("Error fetching dashboard stats")
         raise HTTPException(500, str(e))
 
+
+def dashboard_stats_from(windows: Dict[str, dict]) -> dict:
+    """Dashboard payload from "all" / "current" / "previous" call, positive and rating totals"""
+    total = windows["all"]
+    current = windows["current"]
+    previous = windows["previous"]
+
+    total_calls = total["calls"]
+    # Calculate success rate (Positive / Total)
+    success_rate = round((total["positive"] / total_calls) * 100) if total_calls > 0 else 0
+    # Active users is always 1 for user-specific view
+    active_users = 1
+    avg_rating = round(total["rating_sum"] / total_calls, 1) if total_calls > 0 else 0.0
+
+    current_calls = current["calls"]
+    previous_calls = previous["calls"]
+
+    # Calculate trend
+    if previous_calls > 0:
+        calls_trend = round(((current_calls - previous_calls) / previous_calls) * 100)
+    else:
+        calls_trend = 100 if current_calls > 0 else 0
+
+    # Success rate trend
+    current_success_rate = round((current["positive"] / current_calls) * 100) if current_calls > 0 else 0
+    previous_success_rate = round((previous["positive"] / previous_calls) * 100) if previous_calls > 0 else 0
+    success_trend = current_success_rate - previous_success_rate
+
+    # Calculate rating trend
+    if current_calls > 0 and previous_calls > 0:
+        current_avg = current["rating_sum"] / current_calls
+        previous_avg = previous["rating_sum"] / previous_calls
+        rating_trend = round(current_avg - previous_avg, 1)
+    else:
+        rating_trend = 0.0
+
+    return {
+        "total_calls": total_calls,
+        "success_rate": success_rate,
+        "active_users": active_users,
+        "avg_rating": avg_rating,
+        "trends": {
+            "calls": f"+{calls_trend}%" if calls_trend >= 0 else f"{calls_trend}%",
+            "success_rate": f"+{success_trend}%" if success_trend >= 0 else f"{success_trend}%",
+            "users": "+0%",  # Always 0 for single user view
+            "rating": f"+{rating_trend}" if rating_trend >= 0 else f"{rating_trend}"
+        }
+    }
+
 # -------------------------------------------------------------------
 # RECENT CALLS
 # -------------------------------------------------------------------
@@ -1841,41 +2698,38 @@ async def recent_calls(
     current_user: dict = Depends(get_current_user_dep)
 ):
     """Return recent call summaries for the current logged-in user (newest first)"""
+    userId = current_user["_id"]
+    cached = dashboard_cache.get((userId, "recent", limit))
+    if cached is not None:
+        return cached
+    generation = DASHBOARD_GENERATIONS.get(userId, 0)
     try:
-        userId = current_user["_id"]
-        
-        # Query filter for current user only
-        query_filter = {"userId": userId}
-        
-        calls = list(
-            call_summaries_collection
-            .find(query_filter, {"_id": 0})
-            .sort("callDate", -1)
-            .limit(limit)
-        )
+        calls = await database.call_summaries.recent_for_user(userId, limit)
     except Exception as e:
         logging.error(f"Failed to query recent calls: {e}")
-        calls = []
+        # Not cached: the next refresh should try the database again
+        return {"calls": []}
 
     output = []
     for c in calls:
         exp = c.get("userExperience", "Neutral")
         sentiment = "Happy" if exp == "Positive" else "Upset" if exp == "Negative" else "Neutral"
-        rating_map = {"Positive": 5, "Neutral": 3, "Negative": 2}
 
         output.append({
             "id": c.get("room_id", ""),
             "customerName": c.get("userName") or c.get("userEmail") or "Unknown",
             "sentiment": sentiment,
             "duration": c.get("duration", {}).get("mmss", "0:00"),
-            "rating": rating_map.get(exp, 3),
-            "callDate": c.get("callDate", ""),
+            "rating": RATING_BY_EXPERIENCE.get(exp, DEFAULT_RATING),
+            "callDate": c["callDate"].isoformat() if isinstance(c.get("callDate"), datetime) else c.get("callDate", ""),
             "summary": c.get("summary", ""),
             "callPurpose": c.get("callPurpose", ""),
             "phoneNumber": c.get("phoneNumber")
         })
 
-    return {"calls": output}
+    response = {"calls": output}
+    cache_dashboard((userId, "recent", limit), response, generation)
+    return response
 
 # -------------------------------------------------------------------
 # GET SINGLE CALL SUMMARY
@@ -1883,7 +2737,7 @@ async def recent_calls(
 @app.get("/call-summary/{room_id}")
 async def get_call_summary(room_id: str):
     """Get detailed call summary for a specific room"""
-    summary = call_summaries_collection.find_one({"room_id": room_id}, {"_id": 0})
+    summary = await database.call_summaries.get_by_room(room_id, {"_id": 0})
     if not summary:
         raise HTTPException(404, "Summary not found")
     return summary
@@ -1900,12 +2754,7 @@ async def get_conversations():
         ]
         
         try:
-            saved_sessions = list(
-                sessions_collection
-                .find({}, {"_id": 0, "session_id": 1, "total_messages": 1, "timestamp": 1})
-                .sort("timestamp", DESCENDING)
-                .limit(50)
-            )
+            saved_sessions = await database.transcripts.list_recent(50)
             mongo_sessions = [
                 {"room_id": s["session_id"], "count": s.get("total_messages", 0)}
                 for s in saved_sessions
@@ -1930,7 +2779,7 @@ async def get_conversations():
 @app.get("/session/{session_id}")
 async def get_session(session_id: str):
     try:
-        doc = sessions_collection.find_one({"session_id": session_id}, {"_id": 0})
+        doc = await database.transcripts.get(session_id, {"_id": 0})
         
         if not doc:
             if session_id in STORE:
@@ -1957,7 +2806,7 @@ async def get_session(session_id: str):
 async def debug_sessions():
     """Debug endpoint to see all sessions"""
     try:
-        sessions = list(sessions_collection.find({}, {"_id": 0}).limit(10))
+        sessions = await database.transcripts.sample(10)
         return {"count": len(sessions), "sessions": sessions}
     except Exception as e:
         return {"error": str(e)}
@@ -1972,7 +2821,7 @@ async def debug_room(room_id: str):
             "messages": STORE.get(room_id, [])[-5:] if room_id in STORE else [],
             "has_analysis": room_id in ANALYSIS_STORE,
             "analysis": ANALYSIS_STORE.get(room_id),
-            "db_message_count": messages_collection.count_documents({"room_id": room_id})
+            "db_message_count": await database.messages.count_for_room(room_id)
         }
     except Exception as e:
         return {"error": str(e)}
@@ -1991,15 +2840,26 @@ async def debug_analysis_store():
 # -------------------------------------------------------------------
 @app.get("/health")
 async def health_check():
-    try:
-        client.admin.command("ping")
-        mongodb_status = "connected"
-    except Exception:
-        mongodb_status = "disconnected"
+    mongodb_status = "connected" if await database.ping() else "disconnected"
     return {
         "status": "healthy", 
         "rooms": len(STORE), 
-        "mongodb": mongodb_status
+        "mongodb": mongodb_status,
+        "analysis_mode": ANALYSIS_MODE,
+        "analysis_queue_depth": job_queue.depth(TRANSCRIPT_JOB),
+        "analyses_in_flight": len(analysis_tasks),
+        "end_call_queue_depth": job_queue.depth(END_CALL_JOB),
+        "ingest_idempotency": IDEMPOTENCY_COUNTS,
+        "analyses_completed": analysis_coalescer.completed,
+        "analyses_superseded": analysis_coalescer.superseded,
+        "sentiment_tiers": SENTIMENT_TIER_COUNTS,
+        "trivial_gate": TRIVIAL_GATE_COUNTS,
+        "rolling_summary_folds": sum(state.folds for state in ROLLING_SUMMARIES.values()),
+        "analysis_cache": analysis_cache.stats(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "message_buffer": message_buffer.stats(),
+        "live_viewers": room_events.subscriber_count(),
     }
 
 # -------------------------------------------------------------------
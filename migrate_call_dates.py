@@ -0,0 +1,37 @@
+# migrate_call_dates.py - One-off: ISO-string callDate/createdAt -> BSON dates
+#
+#   python migrate_call_dates.py
+#
+# Converts existing call_summaries, creates the (userId, callDate) index and
+# drops the single-field userId_idx it replaces. Safe to run more than once.
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from pymongo.errors import OperationFailure
+
+from repository import Database
+
+load_dotenv(".env")
+
+
+async def main():
+    database = Database(os.getenv("MONGODB_URI"))
+    try:
+        changed = await database.call_summaries.migrate_string_dates()
+        print(f"✅ Converted dates on {changed} call summaries")
+
+        await database.init()
+        try:
+            await database.call_summaries.collection.drop_index("userId_idx")
+            print("✅ Dropped userId_idx (covered by user_callDate_idx)")
+        except OperationFailure:
+            print("ℹ️ userId_idx already gone")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+    finally:
+        await database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
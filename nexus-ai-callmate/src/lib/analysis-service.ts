@@ -6,6 +6,7 @@ export interface Analysis {
   confidence: number;
   key_points: string[];
   recommendation_to_salesperson: string;
+  source?: "local" | "llm";
 }
 
 export interface AnalysisResponse {
@@ -43,6 +44,26 @@ export interface ConversationsResponse {
 }
 
 const API_BASE = "http://localhost:8000";
+const WS_BASE = API_BASE.replace(/^http/, "ws");
+
+// Live push events from /ws/rooms/{room_id}
+export type LiveRoomEvent =
+  | {
+      type: "snapshot";
+      room_id: string;
+      data: { messages: Message[]; analysis: Analysis | null };
+    }
+  | { id: number; type: "message"; room_id: string; data: Message }
+  | { id: number; type: "analysis"; room_id: string; data: Analysis }
+  | { id: number; type: "ended"; room_id: string; data: unknown }
+  | { type: "ping"; room_id: string };
+
+export interface RoomSubscriptionHandlers {
+  onEvent: (event: LiveRoomEvent) => void;
+  onOpen?: () => void;
+  // Called once the socket is gone for good (or never opened)
+  onClose?: () => void;
+}
 
 /**
  * Fetch the latest sentiment analysis for a room
@@ -91,4 +112,61 @@ export async function fetchSession(sessionId: string): Promise<CallSession> {
     throw new Error(`Failed to fetch session: ${res.statusText}`);
   }
   return (await res.json()) as CallSession;
-}
\ No newline at end of file
+}
+/**
+ * Subscribe to live messages + analysis for a room over WebSocket.
+ * Returns an unsubscribe function.
+ */
+export function subscribeToRoom(
+  roomId: string,
+  handlers: RoomSubscriptionHandlers
+): () => void {
+  const ws = new WebSocket(`${WS_BASE}/ws/rooms/${roomId}`);
+  let closedByClient = false;
+
+  ws.onopen = () => handlers.onOpen?.();
+  ws.onmessage = (msg) => {
+    try {
+      handlers.onEvent(JSON.parse(msg.data) as LiveRoomEvent);
+    } catch (err) {
+      console.error("Bad room event:", err);
+    }
+  };
+  ws.onclose = () => {
+    if (!closedByClient) handlers.onClose?.();
+  };
+
+  return () => {
+    closedByClient = true;
+    ws.close();
+  };
+}
+
+/**
+ * Same live updates over Server-Sent Events, for networks that block
+ * WebSockets. EventSource reconnects on its own and resumes from the
+ * last event id; onClose only fires once it has given up.
+ */
+export function streamRoom(
+  roomId: string,
+  handlers: RoomSubscriptionHandlers
+): () => void {
+  const source = new EventSource(`${API_BASE}/analysis/${roomId}/stream`);
+
+  source.onopen = () => handlers.onOpen?.();
+  for (const type of ["snapshot", "message", "analysis", "ended"]) {
+    source.addEventListener(type, (msg) => {
+      try {
+        const data = JSON.parse((msg as MessageEvent).data);
+        handlers.onEvent({ type, room_id: roomId, data } as LiveRoomEvent);
+      } catch (err) {
+        console.error("Bad room event:", err);
+      }
+    });
+  }
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED) handlers.onClose?.();
+  };
+
+  return () => source.close();
+}
@@ -574,10 +574,15 @@ import { useToast } from "@/hooks/use-toast";
 import {
   fetchLatestAnalysis,
   fetchMessages,
+  subscribeToRoom,
+  streamRoom,
   Analysis,
+  LiveRoomEvent,
   Message,
 } from "@/lib/analysis-service";
 
+const MAX_MESSAGES = 60;
+
 type SentimentUi = {
   label: string;
   emoji: string;
@@ -620,15 +625,17 @@ export default function LiveCall() {
   const roomRef = useRef<Room | null>(null);
   const audioElementRef = useRef<HTMLAudioElement | null>(null);
   const pollTimerRef = useRef<number | null>(null);
+  const unsubscribeRef = useRef<(() => void) | null>(null);
   const { toast } = useToast();
 
   const startPolling = (roomId: string) => {
+    if (pollTimerRef.current) return;
     // poll every 1.5s
     const tick = async () => {
       try {
         const [a, m] = await Promise.allSettled([
           fetchLatestAnalysis(roomId),
-          fetchMessages(roomId, 60),
+          fetchMessages(roomId, MAX_MESSAGES),
         ]);
 
         if (a.status === "fulfilled") setAnalysis(a.value.analysis);
@@ -640,11 +647,62 @@ export default function LiveCall() {
     pollTimerRef.current = window.setInterval(tick, 1500);
   };
 
-  const stopPolling = () => {
+  const clearPollTimer = () => {
     if (pollTimerRef.current) {
       clearInterval(pollTimerRef.current);
       pollTimerRef.current = null;
     }
+  };
+
+  const handleRoomEvent = (event: LiveRoomEvent) => {
+    switch (event.type) {
+      case "snapshot":
+        setMessages(event.data.messages);
+        setAnalysis(event.data.analysis);
+        break;
+      case "message":
+        setMessages((prev) => [...prev, event.data].slice(-MAX_MESSAGES));
+        break;
+      case "analysis":
+        setAnalysis(event.data);
+        break;
+    }
+  };
+
+  // Prefer the WebSocket push channel, then SSE (for proxies that block
+  // WebSockets); poll only while neither is available
+  const startLiveUpdates = (roomId: string, transport: "ws" | "sse" = "ws") => {
+    const subscribe = transport === "ws" ? subscribeToRoom : streamRoom;
+    let opened = false;
+    unsubscribeRef.current = subscribe(roomId, {
+      onOpen: () => {
+        opened = true;
+        clearPollTimer();
+      },
+      onEvent: handleRoomEvent,
+      onClose: () => {
+        unsubscribeRef.current = null;
+        if (transport === "ws" && !opened) {
+          startLiveUpdates(roomId, "sse");
+          return;
+        }
+        startPolling(roomId);
+        // try to get back onto push after a short back-off
+        window.setTimeout(() => {
+          if (pollTimerRef.current) {
+            startLiveUpdates(roomId, transport);
+          }
+        }, 5000);
+      },
+    });
+  };
+
+  const stopPolling = () => {
+    if (unsubscribeRef.current) {
+      unsubscribeRef.current();
+      unsubscribeRef.current = null;
+    }
+    clearPollTimer();
     setAnalysis(null);
     setMessages([]);
   };
@@ -685,7 +743,7 @@ export default function LiveCall() {
           title: "Connected!",
           description: "You're now connected to the AI assistant.",
         });
-        startPolling(newRoomName);
+        startLiveUpdates(newRoomName);
       });
 
       room.on(RoomEvent.Disconnected, () => {
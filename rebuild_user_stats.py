@@ -0,0 +1,29 @@
+# rebuild_user_stats.py - Recompute the per-day user_stats rollups from call_summaries
+#
+#   python rebuild_user_stats.py
+#
+# Run once after deploying the rollups, or any time they look off.
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from repository import Database
+
+load_dotenv(".env")
+
+
+async def main():
+    database = Database(os.getenv("MONGODB_URI"))
+    try:
+        await database.init()
+        days = await database.user_stats.rebuild_from(database.call_summaries.collection)
+        print(f"✅ Rebuilt user_stats: {days} user-day rollups")
+    except Exception as e:
+        print(f"❌ Rebuild failed: {e}")
+    finally:
+        await database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
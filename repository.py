@@ -0,0 +1,481 @@
+# repository.py - Async MongoDB access layer (pymongo AsyncMongoClient)
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import AsyncMongoClient, ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+DUPLICATE_KEY = 11000
+
+# Dashboard rating per call summary userExperience (anything else counts as 3)
+RATING_BY_EXPERIENCE = {"Positive": 5, "Neutral": 3, "Negative": 2}
+DEFAULT_RATING = 3
+
+
+def rating_expression(field: str = "$userExperience") -> dict:
+    return {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": [field, experience]}, "then": value}
+                for experience, value in RATING_BY_EXPERIENCE.items()
+            ],
+            "default": DEFAULT_RATING,
+        }
+    }
+
+
+class UsersRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": user_id})
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email})
+
+    async def create(self, user_doc: dict) -> None:
+        await self.collection.insert_one(user_doc)
+
+
+class MessagesRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert_many(self, docs: List[dict]) -> List[dict]:
+        """
+        Unordered insert; lines already stored (same idempotency key) are
+        skipped. Returns the documents that were actually inserted.
+        """
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+            return docs
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if not errors or any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+            logging.info(f"Skipped {len(errors)} already stored messages")
+            skipped = {err["index"] for err in errors}
+            return [doc for i, doc in enumerate(docs) if i not in skipped]
+
+    async def recent_for_room(self, room_id: str, limit: int) -> List[dict]:
+        cursor = (
+            self.collection
+            .find({"room_id": room_id}, {"_id": 0})
+            .sort("sent_ts", DESCENDING)
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
+
+    async def for_room(self, room_id: str) -> List[dict]:
+        cursor = (
+            self.collection
+            .find({"room_id": room_id}, {"_id": 0})
+            .sort("sent_ts", ASCENDING)
+        )
+        return await cursor.to_list(length=None)
+
+    async def count_for_room(self, room_id: str) -> int:
+        return await self.collection.count_documents({"room_id": room_id})
+
+
+class RoomsRepository:
+    """
+    One document per call room, keyed by the canonical (LiveKit) room name.
+    `alias` is the short name the UI asked for before the userId suffix was
+    added.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def register(self, room_id: str, alias: str, user_id: Optional[str]) -> None:
+        await self.collection.update_one(
+            {"_id": room_id},
+            {"$setOnInsert": {
+                "alias": alias,
+                "userId": user_id,
+                "message_count": 0,
+                "created_at": datetime.now(timezone.utc),
+            }},
+            upsert=True,
+        )
+
+    async def record_messages(self, rooms: Dict[str, dict]) -> None:
+        """
+        Apply per-room ingest counters in one bulk write. `rooms` maps the room
+        id to {"alias", "userId", "count", "first_ts", "last_ts"}.
+        """
+        if not rooms:
+            return
+        now = datetime.now(timezone.utc)
+        await self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": room_id},
+                    {
+                        "$setOnInsert": {"alias": r["alias"], "userId": r["userId"], "created_at": now},
+                        "$inc": {"message_count": r["count"]},
+                        "$min": {"first_ts": r["first_ts"]},
+                        "$max": {"last_ts": r["last_ts"]},
+                        "$set": {"updated_at": now},
+                    },
+                    upsert=True,
+                )
+                for room_id, r in rooms.items()
+            ],
+            ordered=False,
+        )
+
+    async def mark_ended(self, room_id: str) -> None:
+        await self.collection.update_one(
+            {"_id": room_id}, {"$set": {"ended_at": datetime.now(timezone.utc)}}
+        )
+
+    async def resolve(self, room_id: str, user_id: str) -> Optional[dict]:
+        """The room registered under this canonical id, else the user's newest one with this alias"""
+        room = await self.collection.find_one({"_id": room_id})
+        if room is None:
+            room = await self.collection.find_one(
+                {"alias": room_id, "userId": user_id}, sort=[("created_at", DESCENDING)]
+            )
+        return room
+
+
+class TranscriptsRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, session_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"session_id": session_id}, projection)
+
+    async def insert(self, session_doc: dict) -> str:
+        result = await self.collection.insert_one(session_doc)
+        return str(result.inserted_id)
+
+    async def update(self, session_id: str, fields: dict) -> None:
+        await self.collection.update_one({"session_id": session_id}, {"$set": fields})
+
+    async def list_recent(self, limit: int) -> List[dict]:
+        cursor = (
+            self.collection
+            .find({}, {"_id": 0, "session_id": 1, "total_messages": 1, "timestamp": 1})
+            .sort("timestamp", DESCENDING)
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
+
+    async def sample(self, limit: int) -> List[dict]:
+        return await self.collection.find({}, {"_id": 0}).limit(limit).to_list(length=limit)
+
+
+class CallSummariesRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get_by_room(self, room_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"room_id": room_id}, projection)
+
+    async def insert(self, doc: dict) -> str:
+        result = await self.collection.insert_one(doc)
+        return str(result.inserted_id)
+
+    async def window_totals(self, user_id: str, windows: Dict[str, dict]) -> Dict[str, dict]:
+        """
+        Per-window call count, positive count and rating sum for one user in a
+        single $facet aggregation. `windows` maps a name to a callDate range
+        filter of datetimes ({} for all time); every window comes back, zeros
+        if empty.
+        """
+        totals = {
+            "$group": {
+                "_id": None,
+                "calls": {"$sum": 1},
+                "positive": {"$sum": {"$cond": [{"$eq": ["$userExperience", "Positive"]}, 1, 0]}},
+                "rating_sum": {"$sum": rating_expression()},
+            }
+        }
+        facets = {
+            name: ([{"$match": {"callDate": date_range}}] if date_range else []) + [totals]
+            for name, date_range in windows.items()
+        }
+        pipeline = [
+            {"$match": {"userId": user_id}},
+            {"$project": {"_id": 0, "callDate": 1, "userExperience": 1}},
+            {"$facet": facets},
+        ]
+        cursor = await self.collection.aggregate(pipeline)
+        result = (await cursor.to_list(length=1))[0]
+        empty = {"calls": 0, "positive": 0, "rating_sum": 0}
+        return {
+            name: {k: v for k, v in (rows[0] if rows else empty).items() if k != "_id"}
+            for name, rows in result.items()
+        }
+
+    async def mark_rolled_up(self, room_id: str) -> None:
+        await self.collection.update_one({"room_id": room_id}, {"$set": {"rolledUp": True}})
+
+    async def migrate_string_dates(self, fields=("callDate", "createdAt")) -> int:
+        """Rewrite ISO-string date fields as BSON dates; returns documents changed"""
+        changed = 0
+        cursor = self.collection.find(
+            {"$or": [{field: {"$type": "string"}} for field in fields]},
+            {field: 1 for field in fields},
+        )
+        batch: List[UpdateOne] = []
+        async for doc in cursor:
+            update = {}
+            for field in fields:
+                value = doc.get(field)
+                if isinstance(value, str):
+                    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+                    if parsed.tzinfo is None:
+                        parsed = parsed.replace(tzinfo=timezone.utc)
+                    update[field] = parsed
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+            if len(batch) >= 500:
+                changed += (await self.collection.bulk_write(batch, ordered=False)).modified_count
+                batch = []
+        if batch:
+            changed += (await self.collection.bulk_write(batch, ordered=False)).modified_count
+        return changed
+
+    async def recent_for_user(self, user_id: str, limit: int) -> List[dict]:
+        cursor = (
+            self.collection
+            .find({"userId": user_id}, {"_id": 0})
+            .sort("callDate", DESCENDING)
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
+
+
+def call_day(call_date) -> str:
+    """UTC "YYYY-MM-DD" of a callDate, BSON date or (pre-migration) ISO string"""
+    if isinstance(call_date, datetime):
+        return call_date.astimezone(timezone.utc).date().isoformat()
+    return call_date[:10]
+
+
+class UserStatsRepository:
+    """
+    Per-user, per-day (UTC, "YYYY-MM-DD") rollups of call summaries:
+    calls, positives, rating_sum and duration_sum, plus the room_ids they
+    count so a summary is never added twice. Kept current by the end-call
+    job; rebuild_from() recomputes them from call_summaries.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def record_call(self, summary: dict) -> bool:
+        """Add one call summary to its day; False if it was already counted"""
+        user_experience = summary.get("userExperience", "Neutral")
+        day = {"userId": summary["userId"], "day": call_day(summary["callDate"])}
+        room_id = summary["room_id"]
+        for _ in range(2):
+            try:
+                # The room_id guard makes the $inc and the "counted" mark one
+                # write. If the day already has this room the filter misses and
+                # the upsert collides with user_day_idx instead of counting again.
+                await self.collection.update_one(
+                    {**day, "rooms": {"$ne": room_id}},
+                    {
+                        "$inc": {
+                            "calls": 1,
+                            "positives": 1 if user_experience == "Positive" else 0,
+                            "rating_sum": RATING_BY_EXPERIENCE.get(user_experience, DEFAULT_RATING),
+                            "duration_sum": summary.get("duration", {}).get("seconds", 0),
+                        },
+                        "$push": {"rooms": room_id},
+                    },
+                    upsert=True,
+                )
+                return True
+            except DuplicateKeyError:
+                # Either already counted, or another call created the day
+                # document first; in that case the retry updates it
+                if await self.collection.find_one({**day, "rooms": room_id}, {"_id": 1}):
+                    return False
+        return False
+
+    async def window_totals(
+        self, user_id: str, windows: Dict[str, Tuple[Optional[str], Optional[str]]]
+    ) -> Dict[str, dict]:
+        """
+        Same shape as CallSummariesRepository.window_totals, from the user's
+        daily rollups. `windows` maps a name to a [start_day, end_day) range,
+        None meaning unbounded.
+        """
+        days = await self.collection.find(
+            {"userId": user_id}, {"_id": 0, "day": 1, "calls": 1, "positives": 1, "rating_sum": 1}
+        ).to_list(length=None)
+        totals = {}
+        for name, (start, end) in windows.items():
+            rows = [
+                d for d in days
+                if (start is None or d["day"] >= start) and (end is None or d["day"] < end)
+            ]
+            totals[name] = {
+                "calls": sum(d.get("calls", 0) for d in rows),
+                "positive": sum(d.get("positives", 0) for d in rows),
+                "rating_sum": sum(d.get("rating_sum", 0) for d in rows),
+            }
+        return totals
+
+    async def rebuild_from(self, call_summaries) -> int:
+        """Replace every rollup with totals recomputed from call_summaries"""
+        started = datetime.now(timezone.utc)
+        pipeline = [
+            {"$match": {"userId": {"$ne": None}}},
+            {"$group": {
+                "_id": {
+                    "userId": "$userId",
+                    # ISO string or BSON date alike: the first 10 chars are the UTC day
+                    "day": {"$substrBytes": [{"$toString": "$callDate"}, 0, 10]},
+                },
+                "calls": {"$sum": 1},
+                "positives": {"$sum": {"$cond": [{"$eq": ["$userExperience", "Positive"]}, 1, 0]}},
+                "rating_sum": {"$sum": rating_expression()},
+                "duration_sum": {"$sum": {"$ifNull": ["$duration.seconds", 0]}},
+                "rooms": {"$push": "$room_id"},
+            }},
+            {"$project": {
+                "_id": 0,
+                "userId": "$_id.userId",
+                "day": "$_id.day",
+                "calls": 1,
+                "positives": 1,
+                "rating_sum": 1,
+                "duration_sum": 1,
+                "rooms": 1,
+            }},
+            {"$out": self.collection.name},
+        ]
+        await (await call_summaries.aggregate(pipeline)).to_list(length=None)
+
+        # Flag exactly the summaries that were aggregated
+        async for day in self.collection.find({}, {"rooms": 1}):
+            await call_summaries.update_many(
+                {"room_id": {"$in": day["rooms"]}}, {"$set": {"rolledUp": True}}
+            )
+        # A call stored while the aggregation ran may have been counted into
+        # the collection $out just replaced; recording it again is a no-op
+        # if the aggregation already saw it
+        async for summary in call_summaries.find(
+            {"createdAt": {"$gte": started}, "userId": {"$ne": None}}
+        ):
+            await self.record_call(summary)
+        return await self.collection.count_documents({})
+
+    async def is_empty(self) -> bool:
+        return await self.collection.find_one({}, {"_id": 1}) is None
+
+
+class Database:
+    """Owns the async client and hands out one repository per collection"""
+
+    COLLECTIONS = ["messages", "transcripts", "call_summaries", "users", "rooms", "user_stats"]
+
+    def __init__(
+        self,
+        uri: str,
+        db_name: str = "sales_agent",
+        max_pool_size: int = 100,
+        min_pool_size: int = 0,
+        server_selection_timeout_ms: int = 30000,
+        connect_timeout_ms: int = 10000,
+        socket_timeout_ms: Optional[int] = None,
+        wait_queue_timeout_ms: Optional[int] = None,
+    ):
+        self.client = AsyncMongoClient(
+            uri,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+            connectTimeoutMS=connect_timeout_ms,
+            socketTimeoutMS=socket_timeout_ms,
+            waitQueueTimeoutMS=wait_queue_timeout_ms,
+            # BSON dates (call_summaries callDate/createdAt) come back as aware UTC datetimes
+            tz_aware=True,
+        )
+        self.db = self.client[db_name]
+        self.users = UsersRepository(self.db["users"])
+        self.messages = MessagesRepository(self.db["messages"])
+        self.transcripts = TranscriptsRepository(self.db["transcripts"])
+        self.call_summaries = CallSummariesRepository(self.db["call_summaries"])
+        self.rooms = RoomsRepository(self.db["rooms"])
+        self.user_stats = UserStatsRepository(self.db["user_stats"])
+
+    async def ping(self) -> bool:
+        try:
+            await self.client.admin.command("ping")
+            return True
+        except Exception:
+            return False
+
+    async def _create_index(self, collection, keys, **kwargs) -> None:
+        try:
+            await collection.create_index(keys, **kwargs)
+        except OperationFailure as e:
+            logging.warning(f"Could not create {collection.name} index (may already exist): {e}")
+
+    async def init(self) -> None:
+        """Ping, create missing collections and ensure indexes"""
+        await self.client.admin.command("ping")
+        logging.info("✅ Connected to MongoDB")
+
+        existing = await self.db.list_collection_names()
+        for col in self.COLLECTIONS:
+            if col not in existing:
+                await self.db.create_collection(col)
+
+        await self._create_index(
+            self.messages.collection,
+            [("room_id", ASCENDING), ("sent_ts", ASCENDING)],
+            name="room_ts_idx",
+        )
+        await self._create_index(
+            self.messages.collection,
+            [("room_id", ASCENDING), ("idempotency_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$exists": True}},
+            name="room_idempotency_idx",
+        )
+        await self._create_index(self.users.collection, "email", unique=True, name="email_idx")
+        await self._create_index(
+            self.rooms.collection,
+            [("alias", ASCENDING), ("userId", ASCENDING), ("created_at", DESCENDING)],
+            name="alias_user_idx",
+        )
+        try:
+            # Replaced by alias_user_idx
+            await self.rooms.collection.drop_index("alias_idx")
+        except OperationFailure:
+            pass
+        # Every summary lookup is by room_id; unique also enforces one summary per call
+        await self._create_index(
+            self.call_summaries.collection, "room_id", unique=True, name="room_id_idx"
+        )
+        # Serves the dashboard date windows and newest-first recent calls;
+        # supersedes the old single-field userId_idx (see migrate_call_dates.py)
+        await self._create_index(
+            self.call_summaries.collection,
+            [("userId", ASCENDING), ("callDate", DESCENDING)],
+            name="user_callDate_idx",
+        )
+        await self._create_index(
+            self.user_stats.collection,
+            [("userId", ASCENDING), ("day", ASCENDING)],
+            unique=True,
+            name="user_day_idx",
+        )
+        await self._create_index(
+            self.transcripts.collection,
+            [("session_id", ASCENDING), ("timestamp", ASCENDING)],
+            name="session_ts_idx",
+        )
+
+    async def close(self) -> None:
+        await self.client.close()
@@ -0,0 +1,91 @@
+# room_events.py - In-process pub/sub for live room updates (WebSocket / SSE push)
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+
+class Subscription:
+    def __init__(self, room_id: str, maxsize: int):
+        self.room_id = room_id
+        self.queue: "asyncio.Queue[Optional[dict]]" = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Next event, or None on timeout or once the subscriber fell behind."""
+        if self.lagged:
+            return None
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RoomEventHub:
+    """
+    Fans out room events ("message", "analysis", ...) to every live
+    subscriber of that room. Each event carries a monotonically increasing
+    id. A subscriber whose queue fills up is marked lagged and dropped so
+    one slow viewer never holds back publishing.
+
+    The last `history_size` events of each room are kept so a reconnecting
+    viewer can resume from the last id it saw. Ids are only meaningful
+    within one process, hence `epoch`.
+    """
+
+    def __init__(self, queue_size: int = 256, history_size: int = 200):
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.epoch = str(int(time.time()))
+        self.last_id = 0
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._history: Dict[str, Deque[dict]] = {}
+        # id of the newest event evicted from each room's history
+        self._evicted_upto: Dict[str, int] = {}
+
+    def subscribe(self, room_id: str) -> Subscription:
+        sub = Subscription(room_id, self.queue_size)
+        self._subscribers.setdefault(room_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subscribers.get(sub.room_id)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            self._subscribers.pop(sub.room_id, None)
+
+    def publish(self, room_id: str, event_type: str, data) -> dict:
+        self.last_id += 1
+        event = {"id": self.last_id, "type": event_type, "room_id": room_id, "data": data}
+
+        history = self._history.setdefault(room_id, deque())
+        history.append(event)
+        if len(history) > self.history_size:
+            self._evicted_upto[room_id] = history.popleft()["id"]
+
+        for sub in list(self._subscribers.get(room_id, ())):
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logging.warning(f"Dropping lagged subscriber for room {room_id}")
+                sub.lagged = True
+                self.unsubscribe(sub)
+        return event
+
+    def replay(self, room_id: str, after_id: int) -> Optional[List[dict]]:
+        """Events newer than `after_id`, or None if some were already evicted."""
+        if after_id < self._evicted_upto.get(room_id, 0):
+            return None
+        return [e for e in self._history.get(room_id, ()) if e["id"] > after_id]
+
+    def forget(self, room_id: str) -> None:
+        self._history.pop(room_id, None)
+        self._evicted_upto.pop(room_id, None)
+
+    def subscriber_count(self, room_id: Optional[str] = None) -> int:
+        if room_id is not None:
+            return len(self._subscribers.get(room_id, ()))
+        return sum(len(subs) for subs in self._subscribers.values())
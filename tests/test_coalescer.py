@@ -0,0 +1,180 @@
+import asyncio
+
+import pytest
+
+from coalescer import RoomAnalysisCoalescer
+
+
+class FakeAnalyzer:
+    """analyze() that blocks until the test releases the given text"""
+
+    def __init__(self):
+        self.started = []
+        self.cancelled = []
+        self.gates = {}
+
+    def release(self, text, result=None):
+        self.gates.setdefault(text, asyncio.Event()).set()
+        self.results[text] = result if result is not None else {"for": text}
+
+    async def analyze(self, text):
+        self.started.append(text)
+        gate = self.gates.setdefault(text, asyncio.Event())
+        try:
+            await gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        return self.results[text]
+
+    results = {}
+
+
+def record(text, ts):
+    return {"text": text, "sent_ts": ts}
+
+
+def make(cancel_stale):
+    analyzer = FakeAnalyzer()
+    analyzer.results = {}
+    published = []
+    coalescer = RoomAnalysisCoalescer(
+        analyzer.analyze, lambda room, result, ts: published.append((room, result, ts)), cancel_stale
+    )
+    return coalescer, analyzer, published
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_single_line_is_analyzed_and_published():
+    async def scenario():
+        coalescer, analyzer, published = make(cancel_stale=True)
+        call = asyncio.create_task(coalescer.submit("r", record("a", 1)))
+        await settle()
+        analyzer.release("a")
+        assert await call == {"for": "a"}
+        assert published == [("r", {"for": "a"}, 1)]
+        assert coalescer.completed == 1
+        assert "r" not in coalescer.rooms
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("cancel_stale", [True, False])
+def test_superseded_callers_get_the_newest_analysis(cancel_stale):
+    async def scenario():
+        coalescer, analyzer, published = make(cancel_stale)
+        first = asyncio.create_task(coalescer.submit("r", record("a", 1)))
+        await settle()
+        second = asyncio.create_task(coalescer.submit("r", record("b", 2)))
+        third = asyncio.create_task(coalescer.submit("r", record("c", 3)))
+        await settle()
+
+        if cancel_stale:
+            assert analyzer.cancelled == ["a"]
+        else:
+            assert analyzer.cancelled == []
+            analyzer.release("a")
+            await settle()
+        # "b" was replaced while pending and never reached the analyzer
+        assert "b" not in analyzer.started
+        analyzer.release("c")
+
+        results = await asyncio.gather(first, second, third)
+        assert results == [{"for": "c"}] * 3
+        assert published == [("r", {"for": "c"}, 3)]
+        assert coalescer.completed == 1
+        assert coalescer.superseded == 2
+        assert "r" not in coalescer.rooms
+
+    asyncio.run(scenario())
+
+
+def test_older_line_does_not_replace_newer_pending_one():
+    async def scenario():
+        coalescer, analyzer, published = make(cancel_stale=True)
+        newer = asyncio.create_task(coalescer.submit("r", record("new", 5)))
+        await settle()
+        older = asyncio.create_task(coalescer.submit("r", record("old", 4)))
+        await settle()
+        assert analyzer.cancelled == []
+        analyzer.release("new")
+        assert await asyncio.gather(newer, older) == [{"for": "new"}] * 2
+        assert "old" not in analyzer.started
+
+    asyncio.run(scenario())
+
+
+def test_analysis_error_reaches_every_waiter():
+    async def scenario():
+        async def boom(text):
+            raise RuntimeError("groq down")
+
+        coalescer = RoomAnalysisCoalescer(boom, lambda *args: None, cancel_stale=True)
+        with pytest.raises(RuntimeError):
+            await coalescer.submit("r", record("a", 1))
+        assert "r" not in coalescer.rooms
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("cancel_stale", [True, False])
+def test_discard_resolves_in_flight_and_pending_callers(cancel_stale):
+    async def scenario():
+        coalescer, analyzer, published = make(cancel_stale)
+        in_flight = asyncio.create_task(coalescer.submit("r", record("a", 1)))
+        await settle()
+        if not cancel_stale:
+            pending = asyncio.create_task(coalescer.submit("r", record("b", 2)))
+            await settle()
+        else:
+            pending = None
+
+        coalescer.discard("r", {"last": True})
+        await settle()
+
+        assert await asyncio.wait_for(in_flight, 1) == {"last": True}
+        if pending is not None:
+            assert await asyncio.wait_for(pending, 1) == {"last": True}
+        assert "a" in analyzer.cancelled
+        assert published == []
+        assert coalescer.rooms == {}
+
+    asyncio.run(scenario())
+
+
+def test_discard_defaults_to_none_and_room_can_start_again():
+    async def scenario():
+        coalescer, analyzer, published = make(cancel_stale=True)
+        old = asyncio.create_task(coalescer.submit("r", record("a", 1)))
+        await settle()
+        coalescer.discard("r")
+        assert await asyncio.wait_for(old, 1) is None
+
+        # A new call reusing the room id gets its own flight
+        fresh = asyncio.create_task(coalescer.submit("r", record("b", 2)))
+        await settle()
+        analyzer.release("b")
+        assert await asyncio.wait_for(fresh, 1) == {"for": "b"}
+        assert published == [("r", {"for": "b"}, 2)]
+        assert coalescer.rooms == {}
+
+    asyncio.run(scenario())
+
+
+def test_result_finishing_after_discard_is_not_published():
+    async def scenario():
+        coalescer, analyzer, published = make(cancel_stale=True)
+        call = asyncio.create_task(coalescer.submit("r", record("a", 1)))
+        await settle()
+        # Result lands in the same loop turn as the discard
+        analyzer.release("a")
+        coalescer.discard("r")
+        assert await asyncio.wait_for(call, 1) is None
+        await settle()
+        assert published == []
+
+    asyncio.run(scenario())
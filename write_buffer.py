@@ -0,0 +1,116 @@
+# write_buffer.py - Write-behind buffer that batches Mongo inserts
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional
+
+from pymongo.errors import PyMongoError
+
+
+class WriteBehindBuffer:
+    """
+    Collects documents in memory and writes them with insert_many once
+    `flush_size` documents are waiting or `flush_interval` seconds have
+    passed. Failed batches are put back at the front and retried on the
+    next flush; if Mongo stays down the oldest documents are dropped once
+    `max_buffered` is exceeded.
+    """
+
+    def __init__(
+        self,
+        insert_many: Callable[[List[dict]], Awaitable[None]],
+        flush_size: int,
+        flush_interval: float,
+        max_buffered: int,
+    ):
+        self.insert_many = insert_many
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._buffer: Deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.flushes = 0
+        self.flushed_docs = 0
+        self.failed_flushes = 0
+        self.dropped_docs = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def add(self, docs: List[dict]) -> None:
+        self._buffer.extend(doc.copy() for doc in docs)
+        overflow = len(self._buffer) - self.max_buffered
+        if overflow > 0:
+            for _ in range(overflow):
+                self._buffer.popleft()
+            self.dropped_docs += overflow
+            logging.error(f"Write buffer full, dropped {overflow} oldest documents")
+        if len(self._buffer) >= self.flush_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            written = 0
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.flush_size, len(self._buffer)))]
+                started = time.perf_counter()
+                try:
+                    await self.insert_many(batch)
+                except asyncio.CancelledError:
+                    # Shutdown interrupted the write; close() retries it
+                    self._buffer.extendleft(reversed(batch))
+                    raise
+                except PyMongoError as e:
+                    self.failed_flushes += 1
+                    self._buffer.extendleft(reversed(batch))
+                    logging.error(f"Write-behind flush of {len(batch)} documents failed: {e}")
+                    break
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.flushes += 1
+                self.flushed_docs += len(batch)
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+                written += len(batch)
+            return written
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the background flusher and write out whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        written = await self.flush()
+        if self._buffer:
+            logging.error(f"{len(self._buffer)} buffered documents could not be written on shutdown")
+        elif written:
+            logging.info(f"💾 Flushed {written} buffered documents on shutdown")
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._buffer),
+            "flushes": self.flushes,
+            "flushed_docs": self.flushed_docs,
+            "failed_flushes": self.failed_flushes,
+            "dropped_docs": self.dropped_docs,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }